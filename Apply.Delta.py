@@ -0,0 +1,132 @@
+import os
+import re
+import sys
+import gzip
+import json
+import hashlib
+import calendar
+
+# ========================
+# Client side of the package deltas written by Build.Packages.py (e.g. package/myTV.delta.json.gz):
+# brings yesterday's package up to date without downloading it again.
+# Usage: python Apply.Delta.py <myTV.xml | myTV.xml.gz> <myTV.delta.json.gz> [<output>]
+# The package must be exactly the delta's base (sha256); the result is checked against the
+# delta's target before it replaces the output (default: the package itself, same compression).
+# Exit codes: 0 updated or already current, 2 package is not the delta's base (fetch the full
+# package instead), 3 the result did not verify.
+# Self-contained on purpose (no epgcore.py), so a client only needs this file.
+DELTA_FORMAT = "epg-delta/1"
+
+XMLTV_TIME_RE = re.compile(r"^(\d{8}|\d{10}|\d{12}|\d{14})(?:\s*([+-])(\d{2})(\d{2}))?$")
+NO_TIME = -(2 ** 63)
+
+
+def debug(msg):
+    print(f"[DEBUG] {msg}")
+
+
+def parse_xmltv_time(value):
+    # "20260111000000 +0500" -> (epoch seconds, offset minutes, digits)
+    m = XMLTV_TIME_RE.match(value.strip()) if value else None
+    if not m:
+        return NO_TIME, 0, 14
+    digits, sign, off_h, off_m = m.groups()
+    full = digits.ljust(14, "0")
+    offset = 0 if sign is None else (1 if sign == "+" else -1) * (int(off_h) * 60 + int(off_m))
+    epoch = calendar.timegm((int(full[0:4]), int(full[4:6]), int(full[6:8]), int(full[8:10]), int(full[10:12]), int(full[12:14]), 0, 0, 0)) - offset * 60
+    return epoch, offset, len(digits)
+
+
+PACKAGE_BLOCK_RE = re.compile(rb"<(channel|programme)\b([^>]*?)(/>|>.*?</\1>)", re.S)
+PACKAGE_ATTR_RE = re.compile(rb'\b(id|channel|start)="([^"]*)"')
+
+
+def split_package(data):
+    # Top-level <channel>/<programme> blocks of a written package, each with the whitespace that
+    # follows it between siblings ("" after an element with children, "\n  " otherwise)
+    channels = {}
+    programmes = {}
+    for m in PACKAGE_BLOCK_RE.finditer(data):
+        block = m.group(0)
+        attrs = dict(PACKAGE_ATTR_RE.findall(m.group(2)))
+        inner = m.group(3)
+        if inner == b"/>" or b"<" not in inner[1:inner.rindex(b"</")]:
+            block += b"\n  "
+        if m.group(1) == b"channel":
+            channels[attrs.get(b"id", b"").decode("utf-8")] = block
+        else:
+            key = attrs.get(b"start", b"").decode("utf-8")
+            programmes.setdefault(attrs.get(b"channel", b"").decode("utf-8"), {})[key] = block
+    return channels, programmes
+
+
+def join_package(channel_order, programme_order, channels, programmes):
+    # Inverse of split_package for packages grouped per channel and sorted by start
+    parts = [channels[cid] for cid in channel_order]
+    for cid in programme_order:
+        slots = programmes.get(cid, {})
+        parts.extend(slots[start] for start in sorted(slots, key=lambda s: parse_xmltv_time(s)[0]))
+    if not parts:
+        return b"<?xml version='1.0' encoding='utf-8'?>\n<tv />"
+    body = b"".join(parts)
+    if body.endswith(b"\n  "):
+        body = body[:-3]
+    return b"<?xml version='1.0' encoding='utf-8'?>\n<tv>\n  " + body + b"\n</tv>"
+
+
+def apply_delta(base, delta):
+    channels, programmes = split_package(base)
+    for cid in delta["channels"]["remove"]:
+        channels.pop(cid, None)
+    for cid, block in delta["channels"]["set"].items():
+        channels[cid] = block.encode("utf-8")
+    for cid, starts in delta["programmes"]["remove"].items():
+        slots = programmes.get(cid, {})
+        for start in starts:
+            slots.pop(start, None)
+    for cid, slots in delta["programmes"]["set"].items():
+        target = programmes.setdefault(cid, {})
+        for start, block in slots.items():
+            target[start] = block.encode("utf-8")
+    return join_package(delta["channel_order"], delta["programme_order"], channels, programmes)
+
+
+def read_maybe_gzip(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return gzip.decompress(data) if data[:2] == b"\x1f\x8b" else data
+
+
+def main(argv):
+    if len(argv) not in (2, 3):
+        print("Usage: python Apply.Delta.py <package.xml[.gz]> <delta.json.gz> [<output>]")
+        return 1
+    package_path, delta_path = argv[0], argv[1]
+    out_path = argv[2] if len(argv) == 3 else package_path
+    delta = json.loads(read_maybe_gzip(delta_path))
+    if delta.get("format") != DELTA_FORMAT:
+        debug(f"Unsupported delta format: {delta.get('format')}")
+        return 2
+    base = read_maybe_gzip(package_path)
+    base_sha = hashlib.sha256(base).hexdigest()
+    if base_sha == delta["target"]["sha256"]:
+        debug("Package is already up to date")
+        return 0
+    if base_sha != delta["base"]["sha256"]:
+        debug("Package is not the base of this delta; download the full package instead")
+        return 2
+    result = apply_delta(base, delta)
+    if len(result) != delta["target"]["size"] or hashlib.sha256(result).hexdigest() != delta["target"]["sha256"]:
+        debug("Patched package does not match the delta's target hash; keeping the old one")
+        return 3
+    data = gzip.compress(result, 9, mtime=0) if out_path.endswith(".gz") else result
+    tmp_path = out_path + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, out_path)
+    debug(f"Updated {out_path} ({len(result)} bytes, sha256 {delta['target']['sha256'][:16]}...)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,235 @@
+import io
+import os
+import sys
+import glob
+import re
+import time
+import shutil
+import tempfile
+import contextlib
+import xml.etree.ElementTree as ET
+
+from epgcore import load_script, lxml_etree, format_xmltv_time, ProgrammeTable, ZoneOffsets, gzip_compress
+
+# ========================
+# Benchmark of the two XML backends of the channel engine (epgchannel.py) and package builder: lxml against
+# xml.etree.ElementTree. Every step runs on both and must give identical output. The scripts use lxml only
+# where it wins here (a single channel read by the channel engine) and ElementTree everywhere else.
+#   read one:  one channel out of a feed (full streaming parse, byte pre-filter off)
+#   read all:  every channel of a feed
+#   write:     the channel output document of CHANNEL_SCRIPT (streamed, so the backends only
+#              differ in how the programmes were read)
+#   packages:  Build.Packages.py on a copy of channels/ (and pkchannels/), output bytes compared
+#   writers:   one large package (every programme of the feeds) written as a tree + indent_xml (how the
+#              packages used to be written, kept here as the reference) and by the streaming writer of
+#              Build.Packages.py, indented and compact
+# Usage: python Bench.Xml.py [feed.xml ...]   (default: the countries feeds)
+CHANNEL_SCRIPT = "Melo-NZ.py"  # Settings the channel steps run with
+ENGINE_SCRIPT = "epgchannel.py"
+PACKAGE_SCRIPT = "Build.Packages.py"
+DEFAULT_FEEDS = os.path.join("countries", "*.epg.xml")
+PACKAGE_DIRS = ["channels", "pkchannels"]
+REPEAT = 5  # Best of N runs per step and backend
+
+
+def debug(msg):
+    print(f"[DEBUG] {msg}", flush=True)
+
+
+def best_of(func):
+    best = None
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def compare(label, modules, step):
+    # Run step(module) on every backend; print the times and whether the results are identical
+    times = {}
+    results = {}
+    for backend, module in modules.items():
+        times[backend], results[backend] = best_of(lambda: step(module))
+    same = len({repr(r) if not isinstance(r, bytes) else r for r in results.values()}) == 1
+    cells = "  ".join(f"{backend} {times[backend] * 1000:8.1f} ms" for backend in modules)
+    speedup = f"x{times['stdlib'] / times['lxml']:.1f}" if "lxml" in times else ""
+    print(f"{label:44} {cells}  {speedup:6} {'identical' if same else 'DIFFERENT'}", flush=True)
+    return same
+
+
+def with_backend(path, backend):
+    # A copy of the script of its own for one backend
+    name = os.path.splitext(os.path.basename(path))[0].replace("-", "_").replace(".", "_")
+    module = load_script(path, f"bench_{backend}_{name}")
+    module.XML = ET if backend == "stdlib" else lxml_etree
+    if hasattr(module, "SINGLE_CHANNEL_XML"):
+        module.SINGLE_CHANNEL_XML = module.XML
+    module.debug = lambda msg: None
+    return module
+
+
+def channel_ids(path):
+    ids = []
+    for event, elem in ET.iterparse(path):
+        if elem.tag == "channel" and elem.attrib.get("id"):
+            ids.append(elem.attrib["id"])
+    return ids
+
+
+LXML_EMPTY_TEXT_RE = re.compile(rb"<([^\s/>]+)([^>]*)></\1>")  # never written by ElementTree
+
+
+def indent_xml(elem, level=0):
+    i = "\n" + level * "  "
+    if len(elem):
+        if not elem.text or not elem.text.strip():
+            elem.text = i + "  "
+        for e in elem:
+            indent_xml(e, level + 1)
+        if not e.tail or not e.tail.strip():
+            e.tail = i
+    else:
+        if level and (not elem.tail or not elem.tail.strip()):
+            elem.tail = i
+
+
+def xml_bytes(xml, root):
+    # Document bytes exactly as ElementTree writes them; lxml's C serializer differs only in "<x/>",
+    # "<x></x>" for empty text, "&#9;" and carriage returns in text (&#13;)
+    if xml is ET:
+        return ET.tostring(root, encoding="utf-8", xml_declaration=True)
+    data = xml.tostring(root, encoding="utf-8", xml_declaration=True)
+    if b"&#13;" in data:
+        return ET.tostring(ET.fromstring(data), encoding="utf-8", xml_declaration=True)
+    data = data.replace(b"/>", b" />").replace(b"&#9;", b"&#09;")
+    return LXML_EMPTY_TEXT_RE.sub(rb"<\1\2 />", data)
+
+
+def tree_package(xml, channels, table):
+    # The package built as an element tree and indented, the reference for the streaming writer
+    tv = xml.Element("tv")
+    for ch in channels:
+        c = xml.SubElement(tv, "channel", {"id": ch["id"]})
+        xml.SubElement(c, "display-name").text = ch["name"]
+        if ch["logo"]:
+            xml.SubElement(c, "icon", {"src": ch["logo"]})
+    for i in range(len(table)):
+        p = xml.SubElement(tv, "programme", {"channel": table.channels[table.channel[i]]})
+        start = format_xmltv_time(table.start[i], table.offset[i], table.digits[i]) or table.text(table.raw_start[i])
+        if start:
+            p.set("start", start)
+        stop = format_xmltv_time(table.stop[i], table.offset[i], table.digits[i]) or table.text(table.raw_stop[i])
+        if stop:
+            p.set("stop", stop)
+        xml.SubElement(p, "title").text = table.text(table.title[i])
+        for tag, sid in (("sub-title", table.sub[i]), ("desc", table.desc[i])):
+            if table.text(sid):
+                xml.SubElement(p, tag).text = table.text(sid)
+    indent_xml(tv)
+    return xml_bytes(xml, tv)
+
+
+def build_packages(module, workdir):
+    # One run of Build.Packages.py in workdir; returns the package bytes it wrote
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        shutil.rmtree("package", ignore_errors=True)
+        module.PARSED_INPUTS.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            module.main()
+        out = {}
+        for pkg in module.PACKAGES:
+            if os.path.exists(pkg["out_xml"]):
+                with open(pkg["out_xml"], "rb") as f:
+                    out[pkg["out_xml"]] = f.read()
+        return out
+    finally:
+        os.chdir(cwd)
+
+
+def bench_writers(feeds, backends):
+    # Large package from every programme of the feeds; the indented writers must agree byte for byte
+    builder = with_backend(PACKAGE_SCRIPT, "stdlib")
+    channels = {}
+    table = ProgrammeTable()
+    for path in feeds:
+        data = builder.parse_input(path)
+        for info in data["channels"]:
+            channels.setdefault(info["id"], info)
+        for cid, start, stop, offset, digits, title, sub, desc, raw_start, raw_stop in data["rows"]:
+            table.add(cid, start, stop, offset, title, sub.strip() if sub else None, desc.strip() if desc else None,
+                      digits, raw_start, raw_stop)
+    channels = sorted(channels.values(), key=lambda x: (x["name"].lower(), x["id"].lower()))
+
+    xml = {"stdlib": ET, "lxml": lxml_etree}
+    writers = {f"tree + indent_xml ({b})": (lambda x=xml[b]: tree_package(x, channels, table)) for b in backends}
+    writers["streaming, indented"] = lambda: builder.render_package(channels, table)
+    writers["streaming, compact"] = lambda: builder.render_package(channels, table, compact=True)
+    print(f"writers: {len(channels)} channels, {len(table)} programmes", flush=True)
+    results = {}
+    for label, write in writers.items():
+        elapsed, data = best_of(write)
+        packed = gzip_compress(data)
+        results[label] = data
+        print(f"  {label:32} {elapsed * 1000:8.1f} ms  {len(data) / 1e6:7.2f} MB  gz {len(packed) / 1e6:6.2f} MB", flush=True)
+    indented = {data for label, data in results.items() if label != "streaming, compact"}
+    same = len(indented) == 1
+    print(f"  indented outputs {'identical' if same else 'DIFFERENT'}", flush=True)
+    return same
+
+
+def main(argv):
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    feeds = argv or sorted(glob.glob(DEFAULT_FEEDS))
+    backends = ["stdlib", "lxml"]
+    if lxml_etree is None:
+        debug("lxml is not installed; timing the stdlib backend only")
+        backends = ["stdlib"]
+    cfg = load_script(CHANNEL_SCRIPT)
+    channel = {b: with_backend(ENGINE_SCRIPT, b) for b in backends}
+    for module in channel.values():
+        module.PREFILTER_PROGRAMMES = False
+    ok = True
+
+    for path in feeds:
+        ids = channel_ids(path)
+        if not ids:
+            continue
+        name = os.path.basename(path)
+        size = os.path.getsize(path) / 1e6
+        ok &= compare(f"{name} ({size:.1f} MB) read one", channel,
+                      lambda m: m.table_rows(m.read_programmes_from_file(cfg, path, {ids[0]}, ProgrammeTable())))
+        ok &= compare(f"{name} read all {len(ids)}", channel,
+                      lambda m: m.table_rows(m.read_programmes_from_file(cfg, path, set(ids), ProgrammeTable())))
+
+    def write_channel(m):
+        rows = ((table.start[i], table.stop[i], table.text(table.title[i]), table.text(table.sub[i]),
+                 table.text(table.desc[i])) for i in range(len(table)))
+        return m.render_channel_document(cfg, rows, ZoneOffsets(cfg.TARGET_TZ_OFFSET))[0]
+    if feeds:
+        table = channel[backends[0]].read_programmes_from_file(cfg, feeds[0], set(channel_ids(feeds[0])), ProgrammeTable())
+        ok &= compare(f"{os.path.basename(feeds[0])} write {len(table)} programmes", channel, write_channel)
+
+    if os.path.exists(PACKAGE_SCRIPT):
+        workdir = tempfile.mkdtemp(prefix="bench-xml-")
+        try:
+            for d in PACKAGE_DIRS:
+                if os.path.isdir(d):
+                    shutil.copytree(d, os.path.join(workdir, d))
+            packages = {b: with_backend(PACKAGE_SCRIPT, b) for b in backends}
+            ok &= compare("packages (Build.Packages.py)", packages, lambda m: build_packages(m, workdir))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if feeds and os.path.exists(PACKAGE_SCRIPT):
+        ok &= bench_writers(feeds, backends)
+
+    debug("All outputs identical" if ok else "Backends disagree (see DIFFERENT above)")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,669 @@
+import os
+import re
+import gzip
+import json
+import time
+import bisect
+import hashlib
+import sqlite3
+import xml.etree.ElementTree as ET
+
+import epgcore
+from epgcore import (debug, xml_options, ensure_dir, file_digest, load_json_state, save_json_state,
+                     NO_TIME, parse_xmltv_time, format_xmltv_time, ProgrammeTable, open_input,
+                     escape_text, escape_attr, gzip_compress)
+
+# Backend that parses the inputs. ElementTree even when lxml is installed: every programme is walked in
+# Python, and lxml's proxy objects make that slower (x0.8 on the packages, see Bench.Xml.py)
+XML = ET
+
+# ========================
+# One builder for all packages: every distinct input file (by content, so a file present in both
+# channels/ and pkchannels/ counts once) is parsed exactly once, and its programmes are handed to
+# every package that selects them. Adding a package is one more entry here.
+# Each entry:
+#   "name":          label for the log
+#   "dirs":          folders whose *.xml files are read, in order (files sorted by name)
+#   "out_xml", "out_gz": output paths
+# Optional keys:
+#   "channels":      only these channel ids
+#   "exclude":       leave out these channel ids
+#   "window_days":   only programmes starting within N days from today 00:00 (TARGET_TZ_OFFSET)
+#   "strip_text":    strip sub-title/desc whitespace (default True; PK has always kept it)
+#   "delta":         also write the delta from the previous build to this path (see Apply.Delta.py)
+#   "compact":       no indentation whitespace (smaller, for machine consumers; no delta, which needs the layout)
+#   "timeshift":     derived channels showing a channel's programmes later, e.g. {"channel": "CNN.International.us",
+#                    "hours": 1}; optional "id" (default "<channel>.plus<hours>") and "name" (default "<name> +<hours>")
+#   "drop_ended_hours": per channel, leave out the leading programmes that ended more than N hours ago
+#                    (counted in whole hours, so the package changes at most once an hour)
+#   "sqlite":        also write the package to this path as an SQLite database (channels, programmes, full-text index)
+#   "incremental":   folder keeping the rendered programmes of every channel as a segment, with the content hash
+#                    of each input file; a rebuild re-parses only the changed input files (and the other files
+#                    contributing to the same channels), re-renders those channels and concatenates the segments.
+#                    Needs NORMALIZE_PROGRAMMES (output grouped per channel); not used with "sqlite"
+PACKAGES = [
+    {"name": "myTV", "dirs": ["channels"],
+     "out_xml": os.path.join("package", "myTV.xml"), "out_gz": os.path.join("package", "myTV.xml.gz"),
+     "delta": os.path.join("package", "myTV.delta.json.gz"), "incremental": os.path.join("package", "myTV.segments"),
+     "timeshift": [{"channel": "CNN.International.us", "hours": 1}, {"channel": "Geo.News.pk", "hours": 2}]},
+    {"name": "PK", "dirs": ["pkchannels"], "strip_text": False,
+     "out_xml": os.path.join("package", "PK.epg.xml"), "out_gz": os.path.join("package", "PK.epg.xml.gz")},
+    # {"name": "NZ", "dirs": ["nzchannels"], "window_days": 3,
+    #  "out_xml": os.path.join("package", "NZ.epg.xml"), "out_gz": os.path.join("package", "NZ.epg.xml.gz")},
+]
+TARGET_TZ_OFFSET = "+05:00"  # Day boundary for "window_days"
+NORMALIZE_PROGRAMMES = True  # Sort per channel, merge duplicate slots and clip overlaps
+FILL_GAPS = False  # Also insert a filler programme into gaps between programmes
+GAP_FILLER_TITLE = "No Information"  # Title of the gap filler programmes
+# Package .gz files are deflated on every core (GZIP_BLOCK_SIZE / GZIP_WORKERS in epgcore.py)
+# A package whose input files (by content), settings and window match its last build is not built again.
+# The channel writers leave a file untouched while its programmes do not change (see their manifest.json),
+# so a run rebuilds only the packages holding a changed channel.
+PACKAGES_STATE_PATH = os.path.join("package", "packages.state.json")
+PARSED_INPUTS = {}  # file digest -> parsed input; kept between runs when loaded as a module (Run.Daemon.py)
+
+def discover_inputs(dirs):
+    # One file per channel and folder: <name>.xml, or <name>.xml.gz when only the compressed copy exists
+    files = []
+    for d in dirs:
+        if not os.path.isdir(d):
+            debug(f"Skipping missing folder: {d}")
+            continue
+        names = {}
+        for name in os.listdir(d):
+            lower = name.lower()
+            if lower.endswith(".xml"):
+                names[name] = name
+            elif lower.endswith(".xml.gz"):
+                names.setdefault(name[:-3], name)
+        files.extend(os.path.join(d, names[key]) for key in sorted(names))
+    return files
+
+def parse_channel_info(root):
+    infos = []
+    for ch in root.findall("channel"):
+        cid = ch.attrib.get("id", "")
+        dn = ch.find("display-name")
+        name = dn.text.strip() if (dn is not None and dn.text) else ""
+        icon = ch.find("icon")
+        logo = icon.attrib.get("src") if (icon is not None) else None
+        infos.append({"id": cid, "name": name, "logo": logo})
+    return infos
+
+def parse_input(path):
+    # Channel infos and raw programme rows of one file; text is stripped later per package.
+    # A start/stop that does not parse is kept as its source text and written back unchanged.
+    with open_input(path) as f:
+        root = XML.parse(f, XML.XMLParser(**xml_options(XML))).getroot()
+    rows = []
+    unparsed = 0
+    for p in root.findall("programme"):
+        raw_start, raw_stop = p.attrib.get("start"), p.attrib.get("stop")
+        start, offset, digits = parse_xmltv_time(raw_start)
+        stop, _, _ = parse_xmltv_time(raw_stop)
+        raw_start = raw_start if start == NO_TIME else None
+        raw_stop = raw_stop if stop == NO_TIME else None
+        if start == NO_TIME:
+            unparsed += 1
+        rows.append((p.attrib.get("channel"), start, stop, offset, digits,
+                     (p.findtext("title") or "").strip(), p.findtext("sub-title") or None, p.findtext("desc") or None,
+                     raw_start, raw_stop))
+    return {"channels": parse_channel_info(root), "rows": rows, "unparsed": unparsed}
+
+def normalize_programmes(table, channel_order):
+    # Per-channel repair in one sort: order by (channel, start), merge duplicate slots,
+    # clip overlaps and optionally fill gaps. channel_order lists channel ids in output order;
+    # channels without a <channel> entry follow, by id. Programmes whose start did not parse
+    # come first in their channel and are passed through untouched.
+    ranked = list(channel_order) + sorted(set(table.channels) - set(channel_order), key=lambda c: str(c))
+    position = {cid: pos for pos, cid in enumerate(ranked)}
+    rows = table.order(channel_rank=[position[cid] for cid in table.channels])
+    out = table.take([])
+    columns = [(getattr(table, name), getattr(out, name)) for name, _ in table.COLUMNS]
+    ch, start, stop, raw_stop = out.channel, out.start, out.stop, out.raw_stop
+    merged = clipped = filled = 0
+
+    def richness(src, i):
+        return (src.desc[i] >= 0, src.sub[i] >= 0, src.title[i] >= 0 and src.text(src.title[i]) != "", src.stop[i] != NO_TIME)
+
+    for i in rows:
+        last = len(out) - 1
+        if last >= 0 and ch[last] == table.channel[i] and start[last] != NO_TIME:
+            if start[last] == table.start[i]:
+                # Same slot from another input: keep the richer entry
+                merged += 1
+                if richness(table, i) > richness(out, last):
+                    for src, dst in columns:
+                        dst[last] = src[i]
+                continue
+            if stop[last] == NO_TIME or stop[last] > table.start[i]:
+                stop[last] = table.start[i]
+                raw_stop[last] = -1
+                clipped += 1
+            elif FILL_GAPS and stop[last] < table.start[i]:
+                out.add(table.channels[ch[last]], stop[last], table.start[i], out.offset[last],
+                        GAP_FILLER_TITLE, None, None, out.digits[last])
+                filled += 1
+        for src, dst in columns:
+            dst.append(src[i])
+    debug(f"Normalized programmes: {merged} duplicates merged | {clipped} overlaps clipped | {filled} gaps filled")
+    return out
+
+def package_indents(compact):
+    # (sibling indent, child indent, empty element end) of the package layout
+    return ("", "", "/>") if compact else ("\n  ", "\n    ", " />")
+
+def render_channels(channels, compact=False):
+    # One <channel> block per channel, each with the whitespace that precedes the next element
+    i1, i2, empty = package_indents(compact)
+    blocks = []
+    for ch in channels:
+        name = escape_text(ch["name"])
+        name = f"{i2}<display-name>{name}</display-name>" if name else f"{i2}<display-name{empty}"
+        icon = f'{i2}<icon src="{escape_attr(ch["logo"])}"{empty}' if ch["logo"] else ""
+        blocks.append(f'<channel id="{escape_attr(ch["id"])}">{name}{icon}{i1}</channel>')
+    return blocks
+
+def render_programmes(programmes, rows, compact=False):
+    # One <programme> block per row of the table, in the given order
+    i1, i2, empty = package_indents(compact)
+
+    def leaf(tag, escaped):
+        return f"{i2}<{tag}>{escaped}</{tag}>" if escaped else f"{i2}<{tag}{empty}"
+
+    strings = {}  # string id -> escaped text
+    channel_attrs = [escape_attr(cid) for cid in programmes.channels]
+    times = {}  # (epoch, offset, digits) -> XMLTV time; a stop is usually the next programme's start
+
+    def text(sid):
+        if sid not in strings:
+            strings[sid] = escape_text(programmes.strings[sid]) if sid >= 0 else None
+        return strings[sid]
+
+    def when(epoch, offset, digits):
+        key = (epoch, offset, digits)
+        if key not in times:
+            times[key] = format_xmltv_time(epoch, offset, digits)
+        return times[key]
+
+    def raw(sid):
+        return escape_attr(programmes.strings[sid]) if sid >= 0 else None
+
+    blocks = []
+    for i in rows:
+        offset, digits = programmes.offset[i], programmes.digits[i]
+        head = f'<programme channel="{channel_attrs[programmes.channel[i]]}"'
+        start = when(programmes.start[i], offset, digits) or raw(programmes.raw_start[i])
+        if start:
+            head += f' start="{start}"'
+        stop = when(programmes.stop[i], offset, digits) or raw(programmes.raw_stop[i])
+        if stop:
+            head += f' stop="{stop}"'
+        body = leaf("title", text(programmes.title[i]))
+        sub, desc = text(programmes.sub[i]), text(programmes.desc[i])
+        if sub:
+            body += leaf("sub-title", sub)
+        if desc:
+            body += leaf("desc", desc)
+        blocks.append(f"{head}>{body}{i1}</programme>")
+    return blocks
+
+def package_document(body, compact=False):
+    # The package around its concatenated <channel>/<programme> blocks (bytes). Every block holds
+    # children, so indented output is byte-identical to the old indent_xml + ElementTree path
+    # (which left no whitespace after an element with children); compact output has none at all.
+    declaration = b"<?xml version='1.0' encoding='utf-8'?>\n"
+    if not body:
+        return declaration + (b"<tv/>" if compact else b"<tv />")
+    return declaration + b"<tv>" + (b"" if compact else b"\n  ") + body + (b"" if compact else b"\n") + b"</tv>"
+
+def render_package(channels, programmes, compact=False):
+    # The package document streamed straight from the tables, without building a tree
+    parts = render_channels(channels, compact) + render_programmes(programmes, range(len(programmes)), compact)
+    return package_document("".join(parts).encode("utf-8"), compact)
+
+def write_package(pkg, data):
+    ensure_dir(pkg["out_xml"])
+    with open(pkg["out_xml"] + ".part", "wb") as f:
+        f.write(data)
+    os.replace(pkg["out_xml"] + ".part", pkg["out_xml"])
+    ensure_dir(pkg["out_gz"])
+    with open(pkg["out_gz"] + ".part", "wb") as f:
+        f.write(gzip_compress(data))
+    os.replace(pkg["out_gz"] + ".part", pkg["out_gz"])
+    debug(f"Wrote: {pkg['out_xml']} and {pkg['out_gz']}")
+
+SQLITE_SCHEMA = """
+CREATE TABLE channels (id TEXT PRIMARY KEY, name TEXT, logo TEXT, position INTEGER NOT NULL);
+CREATE TABLE programmes (
+    id INTEGER PRIMARY KEY,
+    channel TEXT NOT NULL,
+    start INTEGER,            -- epoch seconds (UTC), NULL when the source's start could not be read
+    stop INTEGER,             -- epoch seconds (UTC), NULL when the source had none
+    start_xmltv TEXT,         -- as written to the XML
+    stop_xmltv TEXT,
+    title TEXT,
+    sub_title TEXT,
+    description TEXT
+);
+"""
+SQLITE_INDEXES = """
+CREATE INDEX programmes_channel_start ON programmes (channel, start);
+"""
+SQLITE_FTS = """
+CREATE VIRTUAL TABLE programmes_fts USING fts5 (title, sub_title, description, content='programmes', content_rowid='id');
+INSERT INTO programmes_fts (programmes_fts) VALUES ('rebuild');
+"""
+
+def write_sqlite(channels, programmes, db_path):
+    # Channels and programmes as written to the XML, loaded in one transaction and swapped in
+    # atomically; the (channel, start) index and the full-text table are built after the load.
+    ensure_dir(db_path)
+    tmp_path = db_path + ".part"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    text = programmes.text
+    con = sqlite3.connect(tmp_path, isolation_level=None)
+
+    def run(script):
+        # executescript() would commit; run the statements inside the open transaction instead
+        for statement in script.split(";"):
+            if statement.strip():
+                con.execute(statement)
+
+    try:
+        con.execute("PRAGMA journal_mode = OFF")
+        con.execute("PRAGMA synchronous = OFF")
+        con.execute("BEGIN")
+        run(SQLITE_SCHEMA)
+        con.executemany("INSERT INTO channels (id, name, logo, position) VALUES (?, ?, ?, ?)",
+                        ((ch["id"], ch["name"], ch["logo"], pos) for pos, ch in enumerate(channels)))
+        con.executemany(
+            "INSERT INTO programmes (channel, start, stop, start_xmltv, stop_xmltv, title, sub_title, description)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((programmes.channels[programmes.channel[i]],
+              programmes.start[i] if programmes.start[i] != NO_TIME else None,
+              programmes.stop[i] if programmes.stop[i] != NO_TIME else None,
+              format_xmltv_time(programmes.start[i], programmes.offset[i], programmes.digits[i]) or text(programmes.raw_start[i]),
+              format_xmltv_time(programmes.stop[i], programmes.offset[i], programmes.digits[i]) or text(programmes.raw_stop[i]),
+              text(programmes.title[i]), text(programmes.sub[i]), text(programmes.desc[i]))
+             for i in range(len(programmes))))
+        run(SQLITE_INDEXES)
+        try:
+            run(SQLITE_FTS)
+        except sqlite3.OperationalError as e:
+            debug(f"SQLite without FTS5, skipping full-text table: {e}")
+        con.execute("COMMIT")
+    finally:
+        con.close()
+    os.replace(tmp_path, db_path)
+    debug(f"Wrote SQLite: {db_path} ({len(channels)} channels, {len(programmes)} programmes)")
+
+def ended_cutoff(pkg):
+    # Programmes ending before this epoch are dropped ("drop_ended_hours"); None keeps all
+    hours = pkg.get("drop_ended_hours")
+    if hours is None:
+        return None
+    return int(time.time() - hours * 3600) // 3600 * 3600
+
+def effective_stop(programmes, i):
+    # A programme whose start could not be read is never counted as ended
+    if programmes.start[i] == NO_TIME:
+        return 2 ** 63 - 1
+    return programmes.stop[i] if programmes.stop[i] != NO_TIME else programmes.start[i]
+
+def drop_ended(programmes, cutoff):
+    # Per channel, the leading programmes that ended by the cutoff; later ones stay even if ended
+    running = set()
+    keep = []
+    for i in range(len(programmes)):
+        if programmes.channel[i] in running or effective_stop(programmes, i) > cutoff:
+            running.add(programmes.channel[i])
+            keep.append(i)
+    if len(keep) < len(programmes):
+        debug(f"Dropped {len(programmes) - len(keep)} programmes that ended before {format_xmltv_time(cutoff, 0)}")
+    return programmes.take(keep)
+
+PACKAGE_BLOCK_RE = re.compile(rb"<(channel|programme)\b([^>]*?)(/>|>.*?</\1>)", re.S)
+PACKAGE_ATTR_RE = re.compile(rb'\b(id|channel|start)="([^"]*)"')
+
+def split_package(data):
+    # Top-level <channel>/<programme> blocks of a written package, each with the whitespace that
+    # follows it between siblings ("" after an element with children, "\n  " otherwise)
+    channels = {}
+    programmes = {}
+    for m in PACKAGE_BLOCK_RE.finditer(data):
+        block = m.group(0)
+        attrs = dict(PACKAGE_ATTR_RE.findall(m.group(2)))
+        inner = m.group(3)
+        if inner == b"/>" or b"<" not in inner[1:inner.rindex(b"</")]:
+            block += b"\n  "
+        if m.group(1) == b"channel":
+            channels[attrs.get(b"id", b"").decode("utf-8")] = block
+        else:
+            key = attrs.get(b"start", b"").decode("utf-8")
+            programmes.setdefault(attrs.get(b"channel", b"").decode("utf-8"), {})[key] = block
+    return channels, programmes
+
+def join_package(channel_order, programme_order, channels, programmes):
+    # Inverse of split_package for packages grouped per channel and sorted by start
+    parts = [channels[cid] for cid in channel_order]
+    for cid in programme_order:
+        slots = programmes.get(cid, {})
+        parts.extend(slots[start] for start in sorted(slots, key=lambda s: parse_xmltv_time(s)[0]))
+    if not parts:
+        return b"<?xml version='1.0' encoding='utf-8'?>\n<tv />"
+    body = b"".join(parts)
+    if body.endswith(b"\n  "):
+        body = body[:-3]
+    return b"<?xml version='1.0' encoding='utf-8'?>\n<tv>\n  " + body + b"\n</tv>"
+
+def write_delta(previous, current, delta_path):
+    if previous is None:
+        debug("No previous package; no delta written")
+        return
+    base_channels, base_programmes = split_package(previous)
+    channels, programmes = split_package(current)
+    if (join_package(list(base_channels), list(base_programmes), base_channels, base_programmes) != previous
+            or join_package(list(channels), list(programmes), channels, programmes) != current):
+        debug("Package is not reproducible from its blocks (not normalized?); no delta written")
+        if os.path.exists(delta_path):
+            os.remove(delta_path)
+        return
+    upsert = {}
+    remove = {}
+    added = changed = removed = 0
+    for cid, slots in programmes.items():
+        base_slots = base_programmes.get(cid, {})
+        for start, block in slots.items():
+            if base_slots.get(start) != block:
+                upsert.setdefault(cid, {})[start] = block.decode("utf-8")
+                if start in base_slots:
+                    changed += 1
+                else:
+                    added += 1
+    for cid, base_slots in base_programmes.items():
+        gone = [start for start in base_slots if start not in programmes.get(cid, {})]
+        if gone:
+            remove[cid] = gone
+            removed += len(gone)
+    delta = {
+        "format": "epg-delta/1",
+        "base": {"sha256": hashlib.sha256(previous).hexdigest(), "size": len(previous)},
+        "target": {"sha256": hashlib.sha256(current).hexdigest(), "size": len(current)},
+        "channel_order": list(channels),
+        "programme_order": list(programmes),
+        "channels": {
+            "set": {cid: block.decode("utf-8") for cid, block in channels.items() if base_channels.get(cid) != block},
+            "remove": [cid for cid in base_channels if cid not in channels],
+        },
+        "programmes": {"set": upsert, "remove": remove},
+    }
+    ensure_dir(delta_path)
+    data = gzip.compress(json.dumps(delta, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 9, mtime=0)
+    with open(delta_path + ".part", "wb") as f:
+        f.write(data)
+    os.replace(delta_path + ".part", delta_path)
+    debug(f"Wrote delta: {delta_path} ({len(data)} bytes) | programmes: {added} added, {changed} changed, {removed} removed")
+
+def timeshift_rules(pkg):
+    # Source channel id -> [(derived id, name suffix, shift in seconds)] of the package's "timeshift" entries
+    rules = {}
+    for rule in pkg.get("timeshift", []):
+        hours = rule["hours"]
+        label = f"{'+' if hours >= 0 else '-'}{abs(hours):g}"
+        default_id = f"{rule['channel']}.{'plus' if hours >= 0 else 'minus'}{abs(hours):g}"
+        rules.setdefault(rule["channel"], []).append((rule.get("id", default_id), rule.get("name"), label, int(hours * 3600)))
+    return rules
+
+def window_for(pkg):
+    days = pkg.get("window_days")
+    if not days:
+        return None
+    compact = TARGET_TZ_OFFSET.replace(":", "")
+    offset = (1 if compact.startswith("+") else -1) * (int(compact[1:3]) * 3600 + int(compact[3:5]) * 60)
+    day0 = (int(time.time()) + offset) // 86400 * 86400 - offset
+    return day0, day0 + days * 86400
+
+def package_key(pkg, script, files):
+    # files: [(path, digest)] of the package's inputs, in reading order
+    key = {"script": script, "package": pkg, "window": window_for(pkg), "cutoff": ended_cutoff(pkg), "inputs": files}
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+def package_channels(pkg, channel_lists):
+    # The package's <channel> entries from the channel infos of its inputs (first one per id wins),
+    # plus the derived timeshift channels, sorted by name
+    wanted = set(pkg["channels"]) if pkg.get("channels") else None
+    excluded = set(pkg.get("exclude", []))
+    shifts = timeshift_rules(pkg)
+    channels_map = {}
+    for infos in channel_lists:
+        for info in infos:
+            if (wanted is None or info["id"] in wanted) and info["id"] not in excluded and info["id"] not in channels_map:
+                channels_map[info["id"]] = info
+                for shifted_id, name, label, _ in shifts.get(info["id"], ()):
+                    if shifted_id not in excluded and shifted_id not in channels_map:
+                        channels_map[shifted_id] = {"id": shifted_id, "name": name or f"{info['name']} {label}", "logo": info["logo"]}
+    return sorted(channels_map.values(), key=lambda x: (x["name"].lower(), x["id"].lower()))
+
+def package_programmes(pkg, inputs):
+    # The package's programme table from parsed inputs: channel filters, text stripping,
+    # the day window and the timeshift copies
+    wanted = set(pkg["channels"]) if pkg.get("channels") else None
+    excluded = set(pkg.get("exclude", []))
+    strip = pkg.get("strip_text", True)
+    window = window_for(pkg)
+    shifts = timeshift_rules(pkg)
+    shifted = []
+    programmes = ProgrammeTable()
+    unparsed = 0
+    for data in inputs:
+        if data is None:
+            continue
+        unparsed += data["unparsed"]
+        for cid, start, stop, offset, digits, title, sub, desc, raw_start, raw_stop in data["rows"]:
+            if wanted is not None and cid not in wanted or cid in excluded:
+                continue
+            if strip:
+                sub = sub.strip() if sub else None
+                desc = desc.strip() if desc else None
+            if start == NO_TIME:
+                # No time to shift or to check against the window: passed through as it was
+                programmes.add(cid, start, stop, offset, title, sub, desc, digits, raw_start, raw_stop)
+                continue
+            # Derived channels get the same row moved by their shift, nothing is parsed again
+            for shifted_id, _, _, seconds in shifts.get(cid, ()):
+                if shifted_id in excluded or window is not None and not window[0] <= start + seconds < window[1]:
+                    continue
+                shifted.append((shifted_id, start + seconds, stop + seconds if stop != NO_TIME else NO_TIME,
+                                offset, title, sub, desc, digits, None, raw_stop))
+            if window is not None and not window[0] <= start < window[1]:
+                continue
+            programmes.add(cid, start, stop, offset, title, sub, desc, digits, raw_start, raw_stop)
+    for row in shifted:
+        programmes.add(*row)
+    if unparsed:
+        debug(f"[{pkg['name']}] Passed through {unparsed} programmes whose start time could not be read")
+    return programmes
+
+def build_full(pkg, paths, parse):
+    inputs = [parse(path) for path in paths]
+    channels = package_channels(pkg, [data["channels"] for data in inputs if data is not None])
+    programmes = package_programmes(pkg, inputs)
+    debug(f"[{pkg['name']}] Channels: {len(channels)} | Programmes: {len(programmes)}")
+    if NORMALIZE_PROGRAMMES:
+        programmes = normalize_programmes(programmes, [ch["id"] for ch in channels])
+    cutoff = ended_cutoff(pkg)
+    if cutoff is not None:
+        programmes = drop_ended(programmes, cutoff)
+    write_package(pkg, render_package(channels, programmes, pkg.get("compact", False)))
+    if pkg.get("sqlite"):
+        write_sqlite(channels, programmes, pkg["sqlite"])
+
+def segment_name(channel_id):
+    return hashlib.sha1(repr(channel_id).encode("utf-8")).hexdigest()[:20] + ".seg"
+
+def programme_channels(data):
+    return sorted({row[0] for row in data["rows"]}, key=str) if data is not None else []
+
+def build_incremental(pkg, paths, digests, parse, settings):
+    seg_dir = pkg["incremental"]
+    state_path = os.path.join(seg_dir, "state.json")
+    state = load_json_state(state_path)
+    # Any change to the script or the package's settings invalidates every segment
+    if state.get("key") != settings:
+        state = {}
+    old_files = state.get("files", {})
+    old_segments = state.get("segments", {})
+    changed = [p for p in paths if old_files.get(p, {}).get("sha1") != digests[p]]
+    removed = [p for p in old_files if p not in digests]
+
+    # Parse changed files, then every file sharing a channel with a parsed file, until closed;
+    # a channel whose segment file went missing is rebuilt the same way
+    dirty = {seg["channel"] for seg in old_segments.values() if not os.path.exists(os.path.join(seg_dir, seg["file"]))}
+    for p in removed:
+        dirty.update(old_files[p]["programme_channels"])
+    parsed = {}
+    pending = changed + [p for p in paths if p not in changed and dirty.intersection(old_files[p]["programme_channels"])]
+    while pending:
+        for p in pending:
+            parsed[p] = parse(p)
+            dirty.update(old_files.get(p, {}).get("programme_channels", []))
+            dirty.update(programme_channels(parsed[p]))
+        pending = [p for p in paths if p not in parsed and dirty.intersection(old_files[p]["programme_channels"])]
+    files = {}
+    for p in paths:
+        if p in parsed:
+            files[p] = {"sha1": digests[p], "channels": parsed[p]["channels"] if parsed[p] is not None else [],
+                        "programme_channels": programme_channels(parsed[p])}
+        else:
+            files[p] = old_files[p]
+
+    channels = package_channels(pkg, [files[p]["channels"] for p in paths])
+    channel_order = [ch["id"] for ch in channels]
+    programmes = normalize_programmes(package_programmes(pkg, [parsed[p] for p in paths if p in parsed]), channel_order)
+    # Derived timeshift channels are as dirty as the channel they copy
+    for source, rules in timeshift_rules(pkg).items():
+        if source in dirty:
+            dirty.update(shifted_id for shifted_id, _, _, _ in rules)
+    segments = {seg["channel"]: seg for seg in old_segments.values() if seg["channel"] not in dirty}
+    os.makedirs(seg_dir, exist_ok=True)
+    rows_by_channel = {}
+    for i in range(len(programmes)):
+        rows_by_channel.setdefault(programmes.channels[programmes.channel[i]], []).append(i)
+    compact = pkg.get("compact", False)
+    for cid, rows in rows_by_channel.items():
+        blocks = [b.encode("utf-8") for b in render_programmes(programmes, rows, compact)]
+        ends = []
+        pos = 0
+        for b in blocks:
+            pos += len(b)
+            ends.append(pos)
+        name = segment_name(cid)
+        with open(os.path.join(seg_dir, name), "wb") as f:
+            f.write(b"".join(blocks))
+        # Running maximum of the stops, so the leading ended programmes are found by bisection
+        stops = []
+        for i in rows:
+            stops.append(max(effective_stop(programmes, i), stops[-1]) if stops else effective_stop(programmes, i))
+        segments[cid] = {"channel": cid, "file": name, "stops": stops, "ends": ends}
+    for seg in old_segments.values():
+        if seg["channel"] not in segments and os.path.exists(os.path.join(seg_dir, seg["file"])):
+            os.remove(os.path.join(seg_dir, seg["file"]))
+    debug(f"[{pkg['name']}] Incremental: {len(changed)} changed / {len(removed)} removed of {len(paths)} input files | "
+          f"{len(rows_by_channel)} of {len(segments)} channel segments re-rendered")
+
+    # Concatenate: channels, then the segments in package channel order, minus ended programmes
+    ranked = channel_order + sorted(set(segments) - set(channel_order), key=lambda c: str(c))
+    cutoff = ended_cutoff(pkg)
+    parts = ["".join(render_channels(channels, compact)).encode("utf-8")]
+    total = 0
+    for cid in ranked:
+        seg = segments.get(cid)
+        if seg:
+            first = 0 if cutoff is None else bisect.bisect_right(seg["stops"], cutoff)
+            if first < len(seg["stops"]):
+                with open(os.path.join(seg_dir, seg["file"]), "rb") as f:
+                    data = f.read()
+                parts.append(data[seg["ends"][first - 1] if first else 0:])
+                total += len(seg["stops"]) - first
+    debug(f"[{pkg['name']}] Channels: {len(channels)} | Programmes: {total}")
+    write_package(pkg, package_document(b"".join(parts), compact))
+    save_json_state(state_path, {"key": settings, "files": files, "segments": {seg["file"]: seg for seg in segments.values()}},
+               separators=(",", ":"))
+
+def main():
+    debug("Starting package builder")
+    inputs = {pkg["name"]: discover_inputs(pkg["dirs"]) for pkg in PACKAGES}
+    digests = {path: file_digest(path) for path in dict.fromkeys(p for files in inputs.values() for p in files)}
+    state = load_json_state(PACKAGES_STATE_PATH)
+    script = file_digest(os.path.abspath(__file__)) + file_digest(os.path.abspath(epgcore.__file__))  # with the shared code
+    keys = {}
+    todo = []
+    for pkg in PACKAGES:
+        if not inputs[pkg["name"]]:
+            # Nothing to read (folder missing or empty): keep the published files rather than emptying them
+            debug(f"[{pkg['name']}] No input files in {', '.join(pkg['dirs'])}; leaving {pkg['out_xml']} untouched")
+            continue
+        keys[pkg["name"]] = package_key(pkg, script, [(path, digests[path]) for path in inputs[pkg["name"]]])
+        outputs = [pkg["out_xml"], pkg["out_gz"]] + ([pkg["sqlite"]] if pkg.get("sqlite") else [])
+        if state.get(pkg["name"]) == keys[pkg["name"]] and all(os.path.exists(p) for p in outputs):
+            debug(f"[{pkg['name']}] Inputs unchanged since the last build; keeping {pkg['out_xml']}")
+        else:
+            todo.append(pkg)
+
+    # Inputs are parsed on first use, once per distinct content; incremental packages use only some
+    parsed = {}
+    reused = 0
+
+    def parse(path):
+        nonlocal reused
+        digest = digests[path]
+        if digest not in parsed:
+            if digest in PARSED_INPUTS:
+                parsed[digest] = PARSED_INPUTS[digest]
+                reused += 1
+            else:
+                try:
+                    parsed[digest] = parse_input(path)
+                except Exception as e:
+                    debug(f"Skipping {path}: {e}")
+                    parsed[digest] = None
+        return parsed[digest]
+
+    for pkg in todo:
+        paths = inputs[pkg["name"]]
+        previous = None
+        delta = pkg.get("delta")
+        if delta and pkg.get("compact"):
+            debug(f"[{pkg['name']}] Compact packages have no delta (it needs the indented layout)")
+            delta = None
+        if delta and os.path.exists(pkg["out_xml"]):
+            with open(pkg["out_xml"], "rb") as f:
+                previous = f.read()
+        incremental = pkg.get("incremental")
+        if incremental and (pkg.get("sqlite") or not NORMALIZE_PROGRAMMES):
+            debug(f"[{pkg['name']}] Incremental builds need NORMALIZE_PROGRAMMES and no \"sqlite\"; building in full")
+            incremental = None
+        if incremental:
+            settings = hashlib.sha1(json.dumps({"script": script, "package": pkg, "window": window_for(pkg)},
+                                               sort_keys=True).encode("utf-8")).hexdigest()
+            build_incremental(pkg, paths, digests, parse, settings)
+        else:
+            build_full(pkg, paths, parse)
+        if delta:
+            with open(pkg["out_xml"], "rb") as f:
+                write_delta(previous, f.read(), delta)
+        state[pkg["name"]] = keys[pkg["name"]]
+
+    for digest in set(PARSED_INPUTS) - set(digests.values()):
+        del PARSED_INPUTS[digest]
+    PARSED_INPUTS.update(parsed)
+    debug(f"Parsed {sum(1 for v in parsed.values() if v is not None) - reused} distinct files ({reused} unchanged since the previous run) "
+          f"for {len(todo)} of {len(PACKAGES)} packages")
+    if todo:
+        save_json_state(PACKAGES_STATE_PATH, state, indent=1, sort_keys=True)
+    debug("Completed")
+
+if __name__ == "__main__":
+    main()
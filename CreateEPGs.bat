@@ -521,19 +521,19 @@ IF EXIST "The-GROAT.py" (
 ) ELSE (
   echo SKIPPED The-GROAT.py (missing)
 )
-IF EXIST "myTV.py" (
-  echo Running myTV.py ...
-  python "myTV.py"
-  IF ERRORLEVEL 1 echo FAILED myTV.py, continuing...
+IF EXIST "Fill.Stubs.py" (
+  echo Running Fill.Stubs.py ...
+  python "Fill.Stubs.py"
+  IF ERRORLEVEL 1 echo FAILED Fill.Stubs.py, continuing...
 ) ELSE (
-  echo SKIPPED myTV.py (missing)
+  echo SKIPPED Fill.Stubs.py (missing)
 )
-IF EXIST "PakistanEPG-Package.py" (
-  echo Running PakistanEPG-Package.py ...
-  python "PakistanEPG-Package.py"
-  IF ERRORLEVEL 1 echo FAILED PakistanEPG-Package.py, continuing...
+IF EXIST "Build.Packages.py" (
+  echo Running Build.Packages.py ...
+  python "Build.Packages.py"
+  IF ERRORLEVEL 1 echo FAILED Build.Packages.py, continuing...
 ) ELSE (
-  echo SKIPPED PakistanEPG-Package.py (missing)
+  echo SKIPPED Build.Packages.py (missing)
 )
 
 echo All done.
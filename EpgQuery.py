@@ -0,0 +1,219 @@
+import os
+import sys
+import mmap
+import time
+import bisect
+import argparse
+import xml.etree.ElementTree as ET
+
+from epgcore import (NO_TIME, xmltv_epoch, format_display_time, open_input, snapshot_path_for, snapshot_is_fresh,
+                     new_snapshot_rows, add_snapshot_row, write_snapshot, snapshot_sections)
+
+# ========================
+# "What is on" queries against a package or channel file without parsing it each time.
+# The first query writes <file>.snap next to it (same layout as the countries snapshots of
+# Fetch.Epgs.py: rows sorted by channel and start, one contiguous row range per channel);
+# later queries map that file and binary-search the start column of the channel.
+#
+# Python:  from EpgQuery import EpgIndex
+#          idx = EpgIndex.open("package/myTV.xml"); idx.now_next("Geo.News.pk", time.time())
+# CLI:     python EpgQuery.py now Geo.News.pk [--at 20260111203000]
+#          python EpgQuery.py range Geo.News.pk 20260111 20260112
+#          python EpgQuery.py grid [--at ...]
+#          python EpgQuery.py channels
+#          python EpgQuery.py --xml channels/Melo-NZ.xml.gz now Melo-NZ   (plain or gzip XML)
+DEFAULT_XML_PATH = os.path.join("package", "myTV.xml")
+DISPLAY_TZ_OFFSET = "+05:00"  # Times printed by the CLI
+
+
+def debug(msg):
+    print(f"[DEBUG] {msg}", file=sys.stderr)
+
+
+def read_rows(xml_path):
+    rows = new_snapshot_rows()
+    root = None
+    with open_input(xml_path) as f:
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if root is None:
+                root = elem
+                continue
+            if event != "end" or elem.tag not in ("channel", "programme"):
+                continue
+            add_snapshot_row(rows, elem)
+            root.clear()
+    return rows
+
+
+class EpgIndex:
+    # Read-only view of a snapshot: numeric columns are cast straight out of the mapping,
+    # strings are decoded only for the rows a query returns.
+
+    @classmethod
+    def open(cls, xml_path=DEFAULT_XML_PATH, rebuild=False):
+        # Map <xml>.snap, (re)building it first when missing or older than the XML
+        snap_path = snapshot_path_for(xml_path)
+        if rebuild or not snapshot_is_fresh(snap_path, xml_path):
+            debug(f"Indexing: {xml_path}")
+            channels, programmes = write_snapshot(read_rows(xml_path), snap_path)
+            debug(f"Wrote index: {snap_path} ({channels} channels, {programmes} programmes)")
+        return cls(snap_path)
+
+    def __init__(self, snap_path):
+        if sys.byteorder != "little":
+            raise RuntimeError("Snapshot columns are little-endian")
+        self.path = snap_path
+        with open(snap_path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.sections = snapshot_sections(self.mm, snap_path)
+        view = memoryview(self.mm)
+        cols = {}
+        for name, typecode in (("chan_offsets", "Q"), ("chan_rows", "Q"), ("start", "q"), ("stop", "q"),
+                               ("title", "i"), ("sub", "i"), ("str_offsets", "Q"), ("desc_offsets", "Q")):
+            off, length = self.sections[name]
+            cols[name] = view[off:off + length].cast(typecode)
+        self.cols = cols
+        chan_blob = self.sections["chan_blob"][0]
+        offs = cols["chan_offsets"]
+        self.channel_ids = [self.mm[chan_blob + offs[i]:chan_blob + offs[i + 1]].decode("utf-8") for i in range(len(offs) - 1)]
+        self.channel_index = {cid: i for i, cid in enumerate(self.channel_ids)}
+        self.strings = {}
+
+    def close(self):
+        self.cols = {}
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def rows_of(self, channel_id):
+        idx = self.channel_index.get(channel_id)
+        if idx is None:
+            return 0, 0
+        rows = self.cols["chan_rows"]
+        return rows[idx], rows[idx + 1]
+
+    def string(self, sid):
+        if sid < 0:
+            return None
+        if sid not in self.strings:
+            base = self.sections["str_blob"][0]
+            offs = self.cols["str_offsets"]
+            self.strings[sid] = self.mm[base + offs[sid]:base + offs[sid + 1]].decode("utf-8")
+        return self.strings[sid]
+
+    def programme(self, channel_id, row, hi):
+        # Row as a dict; a missing stop is taken from the next start of the same channel
+        starts, stops = self.cols["start"], self.cols["stop"]
+        stop = stops[row]
+        if stop == NO_TIME and row + 1 < hi:
+            stop = starts[row + 1]
+        base = self.sections["desc_blob"][0]
+        offs = self.cols["desc_offsets"]
+        desc = self.mm[base + offs[row]:base + offs[row + 1]].decode("utf-8")
+        return {
+            "channel": channel_id,
+            "start": starts[row],
+            "stop": stop,
+            "title": self.string(self.cols["title"][row]),
+            "sub_title": self.string(self.cols["sub"][row]),
+            "desc": desc or None,
+        }
+
+    def on_air_row(self, lo, hi, t):
+        # Last row starting at or before t that has not stopped yet, else None
+        i = bisect.bisect_right(self.cols["start"], t, lo, hi) - 1
+        if i < lo or self.cols["start"][i] == NO_TIME:
+            return None
+        stop = self.cols["stop"][i]
+        if stop == NO_TIME:
+            stop = self.cols["start"][i + 1] if i + 1 < hi else self.cols["start"][i] + 3600
+        return i if stop > t else None
+
+    def now_next(self, channel_id, t):
+        # (programme on air at t or None, the one after it or None)
+        lo, hi = self.rows_of(channel_id)
+        now = self.on_air_row(lo, hi, t)
+        nxt = (now + 1) if now is not None else bisect.bisect_right(self.cols["start"], t, lo, hi)
+        return (self.programme(channel_id, now, hi) if now is not None else None,
+                self.programme(channel_id, nxt, hi) if nxt < hi else None)
+
+    def range(self, channel_id, t_from, t_to):
+        # Programmes of a channel overlapping [t_from, t_to)
+        lo, hi = self.rows_of(channel_id)
+        first = self.on_air_row(lo, hi, t_from)
+        if first is None:
+            first = bisect.bisect_left(self.cols["start"], t_from, lo, hi)
+        last = bisect.bisect_left(self.cols["start"], t_to, lo, hi)
+        return [self.programme(channel_id, i, hi) for i in range(first, last)]
+
+    def grid(self, t):
+        # {channel id: programme on air at t} for every channel that has one
+        out = {}
+        for cid in self.channel_ids:
+            lo, hi = self.rows_of(cid)
+            row = self.on_air_row(lo, hi, t)
+            if row is not None:
+                out[cid] = self.programme(cid, row, hi)
+        return out
+
+
+def parse_cli_time(value):
+    if value in (None, "now"):
+        return int(time.time())
+    epoch = xmltv_epoch(value)
+    if epoch == NO_TIME:
+        raise SystemExit(f"Unrecognized time: {value} (use XMLTV form, e.g. 20260111203000 +0500)")
+    return epoch
+
+
+def print_programme(label, p):
+    if p is None:
+        print(f"{label:5} -")
+        return
+    sub = f" - {p['sub_title']}" if p["sub_title"] else ""
+    print(f"{label:5} {format_display_time(p['start'], DISPLAY_TZ_OFFSET)} -> {format_display_time(p['stop'], DISPLAY_TZ_OFFSET)[11:]}  {p['title'] or ''}{sub}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query a package or channel EPG through its interval index")
+    parser.add_argument("--xml", default=DEFAULT_XML_PATH, help="package or channel XML (default: %(default)s)")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the index even when it is current")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_now = sub.add_parser("now", help="programme on air and the next one")
+    p_now.add_argument("channel")
+    p_now.add_argument("--at", help="XMLTV time (default: now)")
+    p_range = sub.add_parser("range", help="programmes between two times")
+    p_range.add_argument("channel")
+    p_range.add_argument("start")
+    p_range.add_argument("stop")
+    p_grid = sub.add_parser("grid", help="what is on every channel")
+    p_grid.add_argument("--at", help="XMLTV time (default: now)")
+    sub.add_parser("channels", help="list indexed channels")
+    args = parser.parse_args(argv)
+
+    with EpgIndex.open(args.xml, rebuild=args.rebuild) as idx:
+        if args.command == "channels":
+            for cid in idx.channel_ids:
+                lo, hi = idx.rows_of(cid)
+                print(f"{cid}\t{hi - lo}")
+        elif args.command == "now":
+            now, nxt = idx.now_next(args.channel, parse_cli_time(args.at))
+            print_programme("Now", now)
+            print_programme("Next", nxt)
+        elif args.command == "range":
+            for p in idx.range(args.channel, parse_cli_time(args.start), parse_cli_time(args.stop)):
+                print_programme("", p)
+        elif args.command == "grid":
+            t = parse_cli_time(args.at)
+            on_air = idx.grid(t)
+            for cid in idx.channel_ids:
+                p = on_air.get(cid)
+                print(f"{cid:30} {p['title'] if p else '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import os
+import re
+import sys
+import glob
+import json
+import mmap
+import time
+import struct
+import argparse
+from array import array
+import xml.etree.ElementTree as ET
+
+from epgcore import xmltv_epoch, format_display_time, open_input
+
+# ========================
+# Full-text search over the channel and package outputs ("every Hope Channel slot").
+# build:  every source file is tokenized into its own segment (search/segments/*.json) and only
+#         files whose mtime/size changed are tokenized again; the segments are then merged into
+#         search/index.bin: sorted terms -> posting lists of programme ids, plus a programme table.
+# search: the merged index is memory-mapped; terms are found by binary search and posting
+#         lists intersected, so a lookup touches a few pages instead of parsing XML.
+# Usage:  python EpgSearch.py build
+#         python EpgSearch.py search "cnn newsroom" [--in package] [--limit 50]
+SEARCH_INPUTS = [os.path.join("channels", "*.xml"), os.path.join("channels", "*.xml.gz"), os.path.join("package", "*.xml")]
+SEARCH_DIR = "search"
+SEGMENTS_DIR = os.path.join(SEARCH_DIR, "segments")
+MANIFEST_PATH = os.path.join(SEARCH_DIR, "manifest.json")
+INDEX_PATH = os.path.join(SEARCH_DIR, "index.bin")
+DISPLAY_TZ_OFFSET = "+05:00"  # Times printed by the search CLI
+MIN_TERM_LENGTH = 2  # Shorter words are not indexed (numbers are always kept)
+
+# Index layout: same header as the countries snapshots (magic, section count, (offset, length) per section)
+INDEX_MAGIC = b"EPGSRCH1"
+INDEX_SECTIONS = ("term_offsets", "term_blob", "post_offsets", "postings", "doc_offsets", "doc_blob")
+TOKEN_RE = re.compile(r"\w+")
+
+
+def debug(msg):
+    print(f"[DEBUG] {msg}", file=sys.stderr)
+
+
+def tokenize(text):
+    # Lower-cased word set; "CNN Newsroom!" -> {"cnn", "newsroom"}
+    if not text:
+        return set()
+    return {t for t in TOKEN_RE.findall(text.casefold()) if len(t) >= MIN_TERM_LENGTH or t.isdigit()}
+
+
+def segment_path_for(source):
+    # channels/Geo-News.xml -> search/segments/channels__Geo-News.xml.json
+    return os.path.join(SEGMENTS_DIR, source.replace(os.sep, "__").replace("/", "__") + ".json")
+
+
+def build_segment(source):
+    # Programmes of one file: docs [channel, start, stop, title, sub-title] and term -> local doc ids
+    docs = []
+    terms = {}
+    root = None
+    with open_input(source) as f:
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if root is None:
+                root = elem
+                continue
+            if event != "end" or elem.tag not in ("channel", "programme"):
+                continue
+            if elem.tag == "programme":
+                title = (elem.findtext("title") or "").strip()
+                sub = (elem.findtext("sub-title") or "").strip()
+                desc = (elem.findtext("desc") or "").strip()
+                doc_id = len(docs)
+                docs.append([elem.attrib.get("channel", ""), xmltv_epoch(elem.attrib.get("start")),
+                             xmltv_epoch(elem.attrib.get("stop")), title, sub])
+                for term in tokenize(title) | tokenize(sub) | tokenize(desc):
+                    terms.setdefault(term, []).append(doc_id)
+            root.clear()
+    return {"source": source, "docs": docs, "terms": terms}
+
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        debug(f"Ignoring unreadable {path}: {e}")
+        return default
+
+
+def write_json(path, data):
+    tmp_path = path + ".part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"), ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def update_segments():
+    # Re-tokenize only new or changed sources; drop segments of removed ones
+    os.makedirs(SEGMENTS_DIR, exist_ok=True)
+    manifest = load_json(MANIFEST_PATH, {})
+    sources = {p for pattern in SEARCH_INPUTS for p in glob.glob(pattern)}
+    # A channel written both plain and gzipped is indexed once, from the plain file
+    sources = sorted(p for p in sources if not (p.endswith(".gz") and p[:-3] in sources))
+    updated = 0
+    new_manifest = {}
+    for source in sources:
+        st = os.stat(source)
+        sig = f"{st.st_mtime_ns}:{st.st_size}"
+        seg_path = segment_path_for(source)
+        if manifest.get(source) == sig and os.path.exists(seg_path):
+            new_manifest[source] = sig
+            continue
+        try:
+            segment = build_segment(source)
+        except Exception as e:
+            debug(f"Skipping unreadable {source}: {e}")
+            continue
+        write_json(seg_path, segment)
+        new_manifest[source] = sig
+        updated += 1
+    for source in set(manifest) - set(new_manifest):
+        seg_path = segment_path_for(source)
+        if os.path.exists(seg_path):
+            os.remove(seg_path)
+    write_json(MANIFEST_PATH, new_manifest)
+    debug(f"Segments: {len(new_manifest)} sources, {updated} re-tokenized, {len(set(manifest) - set(new_manifest))} removed")
+    return sorted(new_manifest)
+
+
+def string_table(values):
+    offsets = array("Q", [0])
+    blob = bytearray()
+    for v in values:
+        blob += v.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+
+def merge_segments(sources, index_path):
+    # Concatenate segment doc tables into global ids and write the sorted term dictionary
+    postings = {}
+    docs = []
+    for source in sources:
+        segment = load_json(segment_path_for(source), None)
+        if segment is None:
+            continue
+        base = len(docs)
+        for channel, start, stop, title, sub in segment["docs"]:
+            docs.append("\t".join((source, channel, str(start), str(stop), title.replace("\t", " "), sub.replace("\t", " "))))
+        for term, ids in segment["terms"].items():
+            postings.setdefault(term, array("I")).extend(base + i for i in ids)
+    terms = sorted(postings)
+    term_offsets, term_blob = string_table(terms)
+    post_offsets = array("Q", [0])
+    post_data = array("I")
+    for term in terms:
+        post_data.extend(postings[term])
+        post_offsets.append(len(post_data))
+    doc_offsets, doc_blob = string_table(docs)
+    sections = {
+        "term_offsets": term_offsets, "term_blob": term_blob,
+        "post_offsets": post_offsets, "postings": post_data,
+        "doc_offsets": doc_offsets, "doc_blob": doc_blob,
+    }
+    payloads = []
+    for name in INDEX_SECTIONS:
+        data = sections[name]
+        if isinstance(data, array):
+            if sys.byteorder == "big":
+                data = array(data.typecode, data)
+                data.byteswap()
+            data = data.tobytes()
+        payloads.append(data)
+    header_len = len(INDEX_MAGIC) + 8 + 16 * len(INDEX_SECTIONS)
+    table = []
+    pos = header_len
+    for data in payloads:
+        pos += -pos % 8  # keep every column 8-byte aligned for zero-copy casts
+        table.append((pos, len(data)))
+        pos += len(data)
+    tmp_path = index_path + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_MAGIC)
+        f.write(struct.pack("<Q", len(INDEX_SECTIONS)))
+        for off, length in table:
+            f.write(struct.pack("<QQ", off, length))
+        for (off, _), data in zip(table, payloads):
+            f.write(b"\0" * (off - f.tell()))
+            f.write(data)
+    os.replace(tmp_path, index_path)
+    debug(f"Wrote index: {index_path} ({len(terms)} terms, {len(docs)} programmes, {len(post_data)} postings)")
+
+
+class SearchIndex:
+    # Memory-mapped view of index.bin; numeric columns are cast in place
+
+    def __init__(self, index_path=INDEX_PATH):
+        if sys.byteorder != "little":
+            raise RuntimeError("Index columns are little-endian")
+        with open(index_path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError(f"Not a search index: {index_path}")
+        base = len(INDEX_MAGIC)
+        count = struct.unpack_from("<Q", self.mm, base)[0]
+        self.sections = {name: struct.unpack_from("<QQ", self.mm, base + 8 + 16 * i)
+                         for i, name in enumerate(INDEX_SECTIONS[:count])}
+        view = memoryview(self.mm)
+        self.cols = {}
+        for name, typecode in (("term_offsets", "Q"), ("post_offsets", "Q"), ("postings", "I"), ("doc_offsets", "Q")):
+            off, length = self.sections[name]
+            self.cols[name] = view[off:off + length].cast(typecode)
+
+    def close(self):
+        self.cols = {}
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def term_at(self, i):
+        base = self.sections["term_blob"][0]
+        offs = self.cols["term_offsets"]
+        return self.mm[base + offs[i]:base + offs[i + 1]]
+
+    def postings(self, term):
+        # Posting list of one term (sorted programme ids), empty when unknown
+        key = term.encode("utf-8")
+        lo, hi = 0, len(self.cols["term_offsets"]) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo >= len(self.cols["term_offsets"]) - 1 or self.term_at(lo) != key:
+            return []
+        offs = self.cols["post_offsets"]
+        return self.cols["postings"][offs[lo]:offs[lo + 1]]
+
+    def search(self, query):
+        # Programme ids containing every word of the query, rarest word first
+        lists = sorted((self.postings(t) for t in tokenize(query)), key=len)
+        if not lists:
+            return []
+        hits = set(lists[0])
+        for plist in lists[1:]:
+            if not hits:
+                break
+            hits.intersection_update(plist)
+        return sorted(hits)
+
+    def doc(self, doc_id):
+        base = self.sections["doc_blob"][0]
+        offs = self.cols["doc_offsets"]
+        source, channel, start, stop, title, sub = self.mm[base + offs[doc_id]:base + offs[doc_id + 1]].decode("utf-8").split("\t")
+        return {"source": source, "channel": channel, "start": int(start), "stop": int(stop), "title": title, "sub_title": sub}
+
+
+def build():
+    debug("Building search index")
+    sources = update_segments()
+    merge_segments(sources, INDEX_PATH)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Full-text search over channel and package EPGs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="update segments of changed files and rewrite the index")
+    p_search = sub.add_parser("search", help="programmes whose title/sub-title/desc contain every word")
+    p_search.add_argument("query")
+    p_search.add_argument("--in", dest="prefix", help="only sources under this path, e.g. package")
+    p_search.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        build()
+        return
+    t0 = time.perf_counter()
+    with SearchIndex(INDEX_PATH) as idx:
+        ids = idx.search(args.query)
+        lookup_ms = (time.perf_counter() - t0) * 1000
+        docs = (idx.doc(i) for i in ids)
+        if args.prefix:
+            prefix = os.path.normpath(args.prefix) + os.sep
+            docs = (d for d in docs if d["source"].startswith(prefix))
+        docs = sorted(docs, key=lambda d: (d["start"], d["channel"]))
+        for d in docs[:args.limit]:
+            sub_title = f" - {d['sub_title']}" if d["sub_title"] else ""
+            print(f"{format_display_time(d['start'], DISPLAY_TZ_OFFSET)}  {d['channel']:28} {d['title']}{sub_title}  [{d['source']}]")
+        print(f"{len(docs)} programme(s) | lookup {lookup_ms:.2f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
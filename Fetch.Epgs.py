@@ -1,16 +1,28 @@
 import os
-import gzip
-import shutil
-from io import BytesIO
+import time
+import zlib
+import queue
+import threading
+import xml.etree.ElementTree as ET
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import quoteattr
 from urllib.parse import urlparse
 from urllib.request import Request, urlopen
 from http.client import IncompleteRead
-from datetime import datetime, timezone
+
+from epgcore import (debug, ensure_dir, load_json_state, save_json_state, NO_TIME, xmltv_epoch, ZoneOffsets,
+                     FEED_STATE_PATH, RECENT_FETCH_HOURS, iter_decompressed, feed_coverage,
+                     snapshot_path_for, snapshot_is_fresh, new_snapshot_rows, add_snapshot_row, write_snapshot)
 
 # ========================
 # Configuration: add more feeds here
 # Each entry: {"url": "...", "out_xml": "countries/<name>.xml"}
 # Supports .xml and .xml.gz
+# Optional keys:
+#   "channels": [...]      only keep these channel ids (<channel> + <programme>) in out_xml
+#   "keep_full_gz": True   also keep the untouched feed as <out_xml>.full.gz (only used with "channels")
+#   "refresh_hours": 6     how often Run.Daemon.py checks this feed (default: its DEFAULT_REFRESH_HOURS)
 FEEDS = [
         {"url": "https://epgshare01.online/epgshare01/epg_ripper_AU1.xml.gz", "out_xml": os.path.join("countries", "AU.epg.xml")},
         {"url": "https://epgshare01.online/epgshare01/epg_ripper_CA2.xml.gz", "out_xml": os.path.join("countries", "CA.epg.xml")},
@@ -24,7 +36,9 @@ FEEDS = [
         {"url": "https://epgshare01.online/epgshare01/epg_ripper_US2.xml.gz", "out_xml": os.path.join("countries", "US.epg.xml")},
         {"url": "https://epgshare01.online/epgshare01/epg_ripper_ZA1.xml.gz", "out_xml": os.path.join("countries", "ZA.epg.xml")},
 
-        {"url": "https://i.mjh.nz/nzau/epg.xml.gz", "out_xml": os.path.join("countries", "NZAU.epg.xml")},
+        {"url": "https://i.mjh.nz/nzau/epg.xml.gz", "out_xml": os.path.join("countries", "NZAU.epg.xml"),
+         "channels": ["mjh-mood-1286", "mjh-mood-1287", "mjh-mood-1288", "mjh-mood-1289", "mjh-mood-1290", "mjh-ch200", "mjh-tvsn-shopping"],
+         "refresh_hours": 6},
         {"url": "https://epgshare01.online/epgshare01/epg_ripper_ASIANTELEVISION1.xml.gz", "out_xml": os.path.join("countries", "PK-IN.epg.xml")},
 
         
@@ -46,55 +60,270 @@ FEEDS = [
     # Add more feeds as needed
 ]
 
+# Socket reads and gzip inflate run on a thread of their own, PIPELINE_DEPTH chunks ahead of the parser;
+# up to FETCH_WORKERS feeds are fetched at once, so the codec work (zlib releases the GIL) uses every core
+PIPELINE_DEPTH = 8
+FETCH_WORKERS = os.cpu_count() or 1
+WRITE_SNAPSHOTS = True  # Also write countries/<name>.epg.snap (pre-parsed columns) next to each feed
 
-def debug(msg):
-    print(f"[DEBUG] {msg}")
-
-
-def ensure_dir_for(path):
-    d = os.path.dirname(path)
-    if d and not os.path.exists(d):
-        debug(f"Creating directory: {d}")
-        os.makedirs(d, exist_ok=True)
+# Refresh policy: a feed is refetched when it is missing, when the server's ETag/Last-Modified changed,
+# or when the programmes it holds end before the output window of the channel scripts does (the last
+# of OUTPUT_DAYS whole days in OUTPUT_TZ_OFFSET). Short coverage alone is not refetched while the
+# server's validators match the stored copy, nor within RECENT_FETCH_HOURS of the last fetch when
+# the server sends none: the same programmes would come back.
+# Horizons and validators of every feed are kept in FEED_STATE_PATH (epgcore.py) between runs; a stored
+# feed without an entry there (a fresh checkout) has its coverage measured from the file instead.
+OUTPUT_DAYS = 3  # DAYS_OF_EPG_TO_GENERATE of the channel scripts
+OUTPUT_TZ_OFFSET = "+05:00"  # TARGET_TZ_OFFSET of the channel scripts
+FEED_STATE_LOCK = threading.Lock()
+# Snapshots: rows sorted by (channel, start), one contiguous row range per channel (layout in epgcore.py)
 
 
-def get_server_datetime(url):
+def get_validators(url):
+    # HEAD request for the cache validators; empty values when the server does not send them
     try:
-        req = Request(url, method="HEAD")
+        req = Request(url, method="HEAD", headers={"User-Agent": "Mozilla/5.0 (Fetch EPGs)"})
         with urlopen(req, timeout=30) as resp:
-            date_hdr = resp.headers.get("Date")
-            if date_hdr:
-                return datetime.strptime(date_hdr, "%a, %d %b %Y %H:%M:%S GMT").replace(tzinfo=timezone.utc)
-    except Exception:
-        pass
-    return datetime.now(timezone.utc)
+            return {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+    except Exception as e:
+        debug(f"HEAD failed for {url}: {e}")
+    return {"etag": None, "last_modified": None}
+
+
+def load_feed_state():
+    return load_json_state(FEED_STATE_PATH)
+
+
+def save_feed_state(state):
+    # Feeds fetched in parallel save their entries as they finish; one writer at a time,
+    # each from a copy taken at once (entries are replaced, never changed in place)
+    with FEED_STATE_LOCK:
+        save_json_state(FEED_STATE_PATH, dict(state), indent=1, sort_keys=True)
+
+
+def feed_horizon(channel_horizons):
+    # Median channel horizon, so a few dead or oddly long channels do not decide for the feed
+    if not channel_horizons:
+        return None
+    values = sorted(channel_horizons.values())
+    return values[len(values) // 2]
+
+
+def output_window_end(now):
+    return ZoneOffsets(OUTPUT_TZ_OFFSET).days_window(int(now), OUTPUT_DAYS)[1]
 
 
-def file_created_today(path, reference_dt_utc):
-    if not os.path.exists(path):
+def refresh_reason(out_xml, entry, validators, now):
+    # None when the stored feed is still good, otherwise why it has to be fetched
+    if not os.path.exists(out_xml):
+        return "missing"
+    if not entry or entry.get("horizon") is None:
+        return "no recorded coverage"
+    # Only validators both the server and the entry have are compared; a measured entry has none
+    compared = [key for key in ("etag", "last_modified") if validators.get(key) and entry.get(key)]
+    for key in compared:
+        if validators[key] != entry[key]:
+            return f"{key} changed"
+    short_h = (output_window_end(now) - entry["horizon"]) / 3600
+    if short_h > 0 and not compared and now - entry.get("fetched", 0) >= RECENT_FETCH_HOURS * 3600:
+        return f"coverage ends {short_h:.1f}h before the output window"
+    return None
+
+
+def pipelined(items, depth=PIPELINE_DEPTH):
+    # Run a generator on a background thread and hand its items over through a bounded queue;
+    # its exceptions are re-raised here, and closing this generator stops the producer
+    q = queue.Queue(depth)
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                q.put(entry, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
         return False
-    st = os.stat(path)
-    created_local = datetime.fromtimestamp(st.st_ctime).astimezone()
-    ref_local = reference_dt_utc.astimezone(created_local.tzinfo)
-    return created_local.date() == ref_local.date()
 
+    def produce():
+        try:
+            for item in items:
+                if not put((True, item)):
+                    return
+            put((False, None))
+        except BaseException as e:
+            put((False, e))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            more, item = q.get()
+            if not more:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
 
-def download_or_extract(url, out_xml):
-    server_dt = get_server_datetime(url)
-    ensure_dir_for(out_xml)
-    if file_created_today(out_xml, server_dt):
-        debug(f"Fresh file exists for today, skipping: {out_xml}")
-        return
 
+def stream_feed(url, raw_out=None, full_gz_out=None, parse=True):
+    # Download, decompress and parse in one pass: yields ("start"/"end", elem) events
+    # while bytes are still arriving, so network and CPU work overlap.
+    # raw_out receives the decompressed XML, full_gz_out the feed as gzip.
     is_gz = urlparse(url).path.endswith('.xml.gz')
-    debug(f"Downloading: {url}")
     req = Request(url, headers={"User-Agent": "Mozilla/5.0 (Fetch EPGs)"})
-    content = None
+    parser = ET.XMLPullParser(events=("start", "end")) if parse else None
+    deflater = None
+    if full_gz_out and not is_gz:
+        deflater = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    with ExitStack() as stack:
+        resp = stack.enter_context(urlopen(req, timeout=120))
+        raw_f = stack.enter_context(open(raw_out + ".part", "wb")) if raw_out else None
+        gz_f = stack.enter_context(open(full_gz_out + ".part", "wb")) if full_gz_out else None
+        for chunk, data in pipelined(iter_decompressed(resp, is_gz)):
+            if gz_f is not None:
+                gz_f.write(deflater.compress(data) if deflater else chunk)
+            if raw_f is not None:
+                raw_f.write(data)
+            if parser is not None:
+                parser.feed(data)
+                yield from parser.read_events()
+        if parser is not None:
+            parser.close()
+            yield from parser.read_events()
+        if deflater is not None:
+            gz_f.write(deflater.flush())
+    if raw_out:
+        os.replace(raw_out + ".part", raw_out)
+    if full_gz_out:
+        os.replace(full_gz_out + ".part", full_gz_out)
+
+
+def write_projected(events, out_xml, channel_ids):
+    # Consume parse events and only write the <channel>/<programme> elements of the wanted ids
+    wanted = set(channel_ids)
+    kept = 0
+    dropped = 0
+    root = None
+    tmp_path = out_xml + ".part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        for event, elem in events:
+            if root is None:
+                root = elem
+                attrs = "".join(f" {k}={quoteattr(v)}" for k, v in root.attrib.items())
+                f.write(f"<{root.tag}{attrs}>\n")
+                continue
+            if event != "end" or elem.tag not in ("channel", "programme"):
+                continue
+            key = elem.attrib.get("id") if elem.tag == "channel" else elem.attrib.get("channel")
+            if key in wanted:
+                elem.tail = None
+                f.write("  " + ET.tostring(elem, encoding="unicode") + "\n")
+                kept += 1
+            else:
+                dropped += 1
+            # Drop finished elements so memory stays flat on large feeds
+            root.clear()
+        f.write(f"</{root.tag if root is not None else 'tv'}>\n")
+    os.replace(tmp_path, out_xml)
+    debug(f"Projected {out_xml}: kept {kept} elements, dropped {dropped}")
+
+
+def record_snapshot_rows(events, rows, channel_ids=None):
+    # Pass parse events through unchanged while recording programme rows for the snapshot.
+    # Rows are read on the "end" event, before the consumer clears the element.
+    wanted = set(channel_ids) if channel_ids else None
+    for event, elem in events:
+        if event == "end" and elem.tag in ("channel", "programme"):
+            key = elem.attrib.get("id") if elem.tag == "channel" else elem.attrib.get("channel")
+            if key is not None and (wanted is None or key in wanted):
+                add_snapshot_row(rows, elem)
+        yield event, elem
+
+
+def record_horizons(events, horizons, channel_ids=None):
+    # Pass parse events through while tracking the last stop time of every channel
+    wanted = set(channel_ids) if channel_ids else None
+    for event, elem in events:
+        if event == "end" and elem.tag == "programme":
+            cid = elem.attrib.get("channel")
+            if cid is not None and (wanted is None or cid in wanted):
+                end = xmltv_epoch(elem.attrib.get("stop"))
+                if end == NO_TIME:
+                    end = xmltv_epoch(elem.attrib.get("start"))
+                if end != NO_TIME and end > horizons.get(cid, end - 1):
+                    horizons[cid] = end
+        yield event, elem
+
+
+def drain_events(events):
+    # Consume parse events without keeping the finished elements around
+    root = None
+    for event, elem in events:
+        if root is None:
+            root = elem
+        elif event == "end" and elem.tag in ("channel", "programme"):
+            root.clear()
+
+
+def ensure_snapshot(out_xml):
+    # Build the snapshot from an existing XML when it is missing or older than the XML
+    snap_path = snapshot_path_for(out_xml)
+    if not os.path.exists(out_xml) or snapshot_is_fresh(snap_path, out_xml):
+        return
+    debug(f"Building snapshot from: {out_xml}")
+    rows = new_snapshot_rows()
+    drain_events(record_snapshot_rows(ET.iterparse(out_xml, events=("start", "end")), rows))
+    save_snapshot(rows, snap_path)
+
+
+def save_snapshot(rows, snap_path):
+    channels, programmes = write_snapshot(rows, snap_path)
+    debug(f"Wrote snapshot: {snap_path} ({channels} channels, {programmes} programmes)")
+
+
+def download_or_extract(url, out_xml, state, channels=None, keep_full_gz=False):
+    # Returns True when out_xml was (re)written, False when the stored copy was kept
+    ensure_dir(out_xml)
+    key = os.path.basename(out_xml)
+    validators = get_validators(url)
+    entry = state.get(key)
+    if entry is None and os.path.exists(out_xml):
+        horizons = feed_coverage(out_xml, channels)
+        entry = {"horizon": feed_horizon(horizons), "channels": horizons}
+        debug(f"No recorded coverage of {out_xml}; measured {len(horizons)} channels from the file")
+    reason = refresh_reason(out_xml, entry, validators, time.time())
+    if reason is None:
+        short_h = (output_window_end(time.time()) - entry["horizon"]) / 3600
+        if short_h > 0:
+            debug(f"Unchanged since the last fetch (coverage ends {short_h:.1f}h before the output window), skipping: {out_xml}")
+        else:
+            debug(f"Coverage still good (covers the output window), skipping: {out_xml}")
+        if WRITE_SNAPSHOTS:
+            ensure_snapshot(out_xml)
+        return False
+
+    debug(f"Streaming ({reason}): {url}")
+    full_gz = out_xml + ".full.gz" if (channels and keep_full_gz) else None
     attempts = 3
     for attempt in range(1, attempts + 1):
+        rows = new_snapshot_rows()
+        horizons = {}
         try:
-            with urlopen(req, timeout=120) as resp:
-                content = resp.read()
+            if channels:
+                debug(f"Projecting {len(channels)} channel(s) into: {out_xml}")
+                events = record_horizons(stream_feed(url, full_gz_out=full_gz), horizons, channels)
+                if WRITE_SNAPSHOTS:
+                    events = record_snapshot_rows(events, rows, channels)
+                write_projected(events, out_xml, channels)
+            else:
+                debug(f"Saving XML to: {out_xml}")
+                events = record_horizons(stream_feed(url, raw_out=out_xml), horizons)
+                if WRITE_SNAPSHOTS:
+                    events = record_snapshot_rows(events, rows)
+                drain_events(events)
             break
         except IncompleteRead as e:
             debug(f"IncompleteRead on attempt {attempt}/{attempts}: {e}")
@@ -104,24 +333,38 @@ def download_or_extract(url, out_xml):
             debug(f"Download failure on attempt {attempt}/{attempts}: {e}")
             if attempt == attempts:
                 raise
-    if is_gz:
-        debug(f"Decompressing to: {out_xml}")
-        with gzip.GzipFile(fileobj=BytesIO(content)) as gz:
-            with open(out_xml, 'wb') as f:
-                shutil.copyfileobj(gz, f)
-    else:
-        debug(f"Saving XML to: {out_xml}")
-        with open(out_xml, 'wb') as f:
-            f.write(content)
+    if full_gz:
+        debug(f"Kept full feed: {full_gz}")
+    if WRITE_SNAPSHOTS:
+        save_snapshot(rows, snapshot_path_for(out_xml))
+    state[key] = {
+        "url": url,
+        "etag": validators.get("etag"),
+        "last_modified": validators.get("last_modified"),
+        "fetched": int(time.time()),
+        "horizon": feed_horizon(horizons),
+        "channels": horizons,
+    }
+    if state[key]["horizon"] is not None:
+        debug(f"Coverage of {out_xml}: {(state[key]['horizon'] - time.time()) / 3600:.1f}h ahead ({len(horizons)} channels)")
+    return True
+
+
+def fetch_entry(entry, state):
+    try:
+        return download_or_extract(entry["url"], entry["out_xml"], state, entry.get("channels"), entry.get("keep_full_gz", False))
+    except Exception as e:
+        debug(f"Failed to process {entry['url']}: {e}")
+        return False
+    finally:
+        save_feed_state(state)
 
 
 def main():
-    debug("Starting bulk EPG fetcher")
-    for entry in FEEDS:
-        try:
-            download_or_extract(entry["url"], entry["out_xml"])
-        except Exception as e:
-            debug(f"Failed to process {entry['url']}: {e}")
+    debug(f"Starting bulk EPG fetcher ({FETCH_WORKERS} feed(s) at a time)")
+    state = load_feed_state()
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+        list(pool.map(lambda entry: fetch_entry(entry, state), FEEDS))
     debug("Bulk fetch completed")
 
 
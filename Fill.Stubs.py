@@ -0,0 +1,228 @@
+import os
+import re
+import glob
+import hashlib
+import time
+import xml.etree.ElementTree as ET
+
+import epgcore
+import epgchannel
+from epgcore import debug, file_digest, load_json_state, save_json_state, NO_TIME, xmltv_epoch, ZoneOffsets
+from epgchannel import render_document
+
+# ========================
+# Fills programme-less channel files in channels/ (stubs that only hold a <channel>)
+# from the country feeds, without a dedicated script per channel.
+# Every feed is parsed once: its <channel> list goes into a normalized display-name/id
+# index, and the programmes of channels that could match a stub are kept on the way.
+CHANNELS_DIR = "channels"
+COUNTRIES_GLOB = os.path.join("countries", "*.epg.xml")
+STUBS_STATE_PATH = os.path.join(CHANNELS_DIR, "stubs.json")  # Files filled by this script (refreshed on every run)
+# Channel manifest shared with the channel scripts: file -> channel id, fingerprint of the programmes
+# as written, programme count and coverage. A stub whose fingerprint did not change is not rewritten.
+MANIFEST_PATH = os.path.join(CHANNELS_DIR, "manifest.json")
+DAYS_OF_EPG_TO_GENERATE = 3  # Number of days to keep
+TARGET_TZ_OFFSET = "+05:00"  # Pakistan Standard Time
+
+# Manual resolutions when the names do not match: stub channel id -> (countries file name, source channel id)
+STUB_OVERRIDES = {
+    # "DW.English.de": ("UK.epg.xml", "DW.English.uk"),
+}
+
+# Words dropped before comparing names ("CNN HD" == "CNN")
+NAME_NOISE = {"hd", "sd", "fhd", "uhd", "tv", "channel", "the"}
+
+
+def country_code(value):
+    # Trailing two-letter country code of ids such as "CNN.us" or "Melo-NZ", else None
+    words = [w for w in re.split(r"[^0-9a-z]+", (value or "").casefold()) if w]
+    if len(words) > 1 and len(words[-1]) == 2 and words[-1].isalpha():
+        return words[-1]
+    return None
+
+
+def source_country(source):
+    # Country of a (feed, channel id) candidate: the id's own code, else the feed's ("US-Samsung.epg.xml")
+    feed, cid = source
+    prefix = re.split(r"[^0-9a-z]+", feed.casefold())[0]
+    return country_code(cid) or (prefix if len(prefix) == 2 and prefix.isalpha() else None)
+
+
+def normalize_key(value):
+    # "Geo.News.pk" / "Geo News HD" / "Geo-News" -> "geonews"
+    if not value:
+        return ""
+    words = [w for w in re.split(r"[^0-9a-z]+", value.casefold()) if w]
+    if country_code(value):
+        words = words[:-1]
+    core = [w for w in words if w not in NAME_NOISE] or words
+    return "".join(core)
+
+
+def channel_header(stub):
+    # The stub's <channel> as indent_xml leaves it inside <tv>
+    channel = stub["channel"]
+    channel.tail = None
+    ET.indent(channel, level=1)
+    return ET.tostring(channel, encoding="unicode")
+
+
+def find_stubs(state):
+    # Channel files without programmes, plus the ones this script filled before
+    stubs = []
+    for path in sorted(glob.glob(os.path.join(CHANNELS_DIR, "*.xml"))):
+        name = os.path.basename(path)
+        try:
+            root = ET.parse(path).getroot()
+        except Exception as e:
+            debug(f"Skipping unreadable {path}: {e}")
+            continue
+        if root.find("programme") is not None and name not in state:
+            continue
+        ch = root.find("channel")
+        if ch is None or not ch.attrib.get("id"):
+            continue
+        display_names = [dn.text.strip() for dn in ch.findall("display-name") if dn.text and dn.text.strip()]
+        keys = {normalize_key(ch.attrib["id"])} | {normalize_key(n) for n in display_names}
+        keys.discard("")
+        stubs.append({"file": name, "path": path, "channel": ch, "id": ch.attrib["id"], "keys": keys,
+                      "filled": root.find("programme") is not None})
+    return stubs
+
+
+def scan_feed(feed_path, stub_keys, wanted_ids, index, window):
+    # One pass: index every <channel> and keep windowed programmes of channels matching a stub
+    feed = os.path.basename(feed_path)
+    matching = set(wanted_ids)
+    programmes = {}
+    root = None
+    for event, elem in ET.iterparse(feed_path, events=("start", "end")):
+        if root is None:
+            root = elem
+            continue
+        if event != "end" or elem.tag not in ("channel", "programme"):
+            continue
+        if elem.tag == "channel":
+            cid = elem.attrib.get("id")
+            if cid:
+                keys = {normalize_key(cid)} | {normalize_key(dn.text) for dn in elem.findall("display-name") if dn.text}
+                keys.discard("")
+                for key in keys:
+                    index.setdefault(key, []).append((feed, cid))
+                if keys & stub_keys:
+                    matching.add(cid)
+        else:
+            cid = elem.attrib.get("channel")
+            if cid in matching:
+                start = xmltv_epoch(elem.attrib.get("start"))
+                stop = xmltv_epoch(elem.attrib.get("stop"))
+                if start != NO_TIME and window[0] <= start < window[1]:
+                    programmes.setdefault(cid, []).append({
+                        "start": start,
+                        "stop": stop if stop != NO_TIME else None,
+                        "title": (elem.findtext("title") or "").strip(),
+                        "sub": (elem.findtext("sub-title") or "").strip() or None,
+                        "desc": (elem.findtext("desc") or "").strip() or None,
+                    })
+        root.clear()
+    return programmes
+
+
+def resolve(stub, index, programmes):
+    # Prefer a manual override, then an exact id match, then a source of the stub's own country,
+    # then the matching source with most programmes. A stub with a country code never takes a
+    # channel of another country ("CNN.us" is not "Cnn.Hd.ph").
+    override = STUB_OVERRIDES.get(stub["id"])
+    if override:
+        return override
+    country = country_code(stub["id"])
+    candidates = {c for key in stub["keys"] for c in index.get(key, [])
+                  if country is None or source_country(c) in (country, None)}
+    if not candidates:
+        return None
+    return max(candidates, key=lambda c: (len(programmes.get(c, [])) > 0, c[1] == stub["id"],
+                                          source_country(c) == country, len(programmes.get(c, [])), c))
+
+
+def reset_stub(stub, manifest):
+    # Back to the bare <channel> stub, so programmes of a source that is gone do not stay behind
+    data = ("<?xml version='1.0' encoding='utf-8'?>\n<tv>\n  " + channel_header(stub) + "\n</tv>").encode("utf-8")
+    with open(stub["path"], "wb") as f:
+        f.write(data)
+    manifest.pop(stub["file"], None)
+
+
+def write_stub(stub, items, zone, manifest):
+    # Returns True when the file was written, False when the manifest shows the same programmes
+    items.sort(key=lambda x: x["start"])
+    rows = []
+    for i, it in enumerate(items):
+        stop = it["stop"] or (items[i + 1]["start"] if i + 1 < len(items) else it["start"] + 3600)
+        rows.append((it["start"], stop, it["title"], it["sub"], it["desc"]))
+    header = channel_header(stub)
+    digest = hashlib.sha256(repr((file_digest(os.path.abspath(__file__)), file_digest(os.path.abspath(epgcore.__file__)),
+                                  file_digest(os.path.abspath(epgchannel.__file__)), header, zone.spec)).encode("utf-8"))
+    data, entry = render_document(stub["id"], header, rows, zone, digest, skip_empty=True)
+    if stub["filled"] and manifest.get(stub["file"], {}).get("sha256") == entry["sha256"]:
+        return False
+    with open(stub["path"], "wb") as f:
+        f.write(data)
+    manifest[stub["file"]] = entry
+    return True
+
+
+def main():
+    debug("Starting channel stub filler")
+    state = load_json_state(STUBS_STATE_PATH)
+    stubs = find_stubs(state)
+    debug(f"Stub channels: {len(stubs)}")
+    if not stubs:
+        return
+    zone = ZoneOffsets(TARGET_TZ_OFFSET)
+    window = zone.days_window(int(time.time()), DAYS_OF_EPG_TO_GENERATE)
+
+    stub_keys = set().union(*(s["keys"] for s in stubs))
+    index = {}
+    programmes = {}
+    for feed_path in sorted(glob.glob(COUNTRIES_GLOB)):
+        feed = os.path.basename(feed_path)
+        wanted = {src for cid, (f, src) in STUB_OVERRIDES.items() if f == feed}
+        debug(f"Indexing: {feed_path}")
+        try:
+            found = scan_feed(feed_path, stub_keys, wanted, index, window)
+        except Exception as e:
+            debug(f"Failed reading {feed_path}: {e}")
+            continue
+        for cid, items in found.items():
+            programmes[(feed, cid)] = items
+    debug(f"Index keys: {len(index)}")
+
+    new_state = {}
+    manifest = load_json_state(MANIFEST_PATH)
+    unchanged = 0
+    reset = 0
+    for stub in stubs:
+        source = resolve(stub, index, programmes)
+        items = programmes.get(tuple(source), []) if source else []
+        if not items:
+            debug(f"No source programmes for {stub['file']} ({stub['id']})")
+            if stub["filled"] and stub["file"] in state:
+                reset_stub(stub, manifest)
+                reset += 1
+                debug(f"Reset {stub['file']} to its stub (was filled from {state[stub['file']]['feed']}:{state[stub['file']]['channel']})")
+            continue
+        if source[1] != stub["id"] and stub["id"] not in STUB_OVERRIDES:
+            debug(f"Name match for {stub['id']}: {source[0]}:{source[1]} (country {source_country(source) or 'unknown'})")
+        new_state[stub["file"]] = {"feed": source[0], "channel": source[1], "programmes": len(items)}
+        if write_stub(stub, items, zone, manifest):
+            debug(f"Filled {stub['file']} from {source[0]}:{source[1]} ({len(items)} programmes)")
+        else:
+            unchanged += 1
+
+    save_json_state(STUBS_STATE_PATH, new_state, indent=2, sort_keys=True)
+    save_json_state(MANIFEST_PATH, manifest, indent=1, sort_keys=True)
+    debug(f"Filled {len(new_state)} of {len(stubs)} stub channels ({unchanged} unchanged, not rewritten, {reset} reset)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import os
+import sys
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import epgchannel
+from epgcore import load_script
+
+# ========================
+# Long-running alternative to the daily workflow: every feed of Fetch.Epgs.py is checked on
+# its own interval (FEEDS "refresh_hours", with jitter), and only the channel scripts reading
+# a feed that changed are re-run, followed by the stub filler and the packages whose inputs moved.
+# Feeds due at the same time are fetched FETCH_WORKERS (Fetch.Epgs.py) at a time.
+# The pipeline scripts are loaded once as modules and kept in memory between cycles.
+# Usage: python Run.Daemon.py          (run forever)
+#        python Run.Daemon.py --once   (one full cycle, then exit)
+FETCH_SCRIPT = "Fetch.Epgs.py"
+CHANNEL_SCRIPTS = [
+    "GROAT-NZ.py",
+    "Big-Rig-NZ.py",
+    "Melo-NZ.py",
+    "Juice-TV-NZ.py",
+    "J2-NZ.py",
+    "CH200-NZ.py",
+    "TVSN-Shopping-NZ.py",
+    "Firstlight-NZ.py",
+    "Hope-Channel-NZ.py",
+]
+STUBS_SCRIPT = "Fill.Stubs.py"
+SEARCH_SCRIPT = "EpgSearch.py"  # Search index, updated after any package rebuild
+# Package script -> folders it builds from; rebuilt when a file in them changed
+PACKAGE_SCRIPTS = {
+    "Build.Packages.py": ["channels", "pkchannels"],
+}
+DEFAULT_REFRESH_HOURS = 24  # Check interval of feeds without "refresh_hours"
+JITTER_FRACTION = 0.1  # Spread every interval by up to +/-10% so feeds do not line up
+MAX_SLEEP_SECONDS = 15 * 60  # Wake up at least this often (day rollover, new files)
+TARGET_TZ_OFFSET = "+05:00"  # Day boundary at which all channel outputs are rebuilt
+
+
+def debug(msg):
+    print(f"[DEBUG] {msg}", flush=True)
+
+
+def run_step(name, func):
+    debug(f"Running {name} ...")
+    try:
+        func()
+    except (Exception, SystemExit) as e:
+        debug(f"FAILED: {name} ({e}), continuing")
+
+
+def channel_inputs(module):
+    # Countries XML files a channel script reads; None when it does not declare them
+    if not hasattr(module, "COUNTRIES_XML_PATH"):
+        return None
+    paths = {os.path.normpath(module.COUNTRIES_XML_PATH)}
+    for src in getattr(module, "EXTRA_SOURCES", []):
+        paths.add(os.path.normpath(src["xml"]))
+    return paths
+
+
+def folder_signature(folders):
+    sig = []
+    for folder in folders:
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.endswith((".xml", ".xml.gz")):
+                st = os.stat(os.path.join(folder, name))
+                sig.append((folder, name, st.st_mtime_ns, st.st_size))
+    return sig
+
+
+def variant_windows(module):
+    # Day windows of a channel script's output variants (OUTPUT_VARIANTS); they move at each zone's midnight
+    if not hasattr(module, "OUTPUT_VARIANTS"):
+        return None
+    return [window for _, _, window in epgchannel.output_variants(module, datetime.now(timezone.utc))]
+
+
+def target_date():
+    compact = TARGET_TZ_OFFSET.replace(":", "")
+    sign = 1 if compact.startswith("+") else -1
+    tz = timezone(sign * timedelta(hours=int(compact[1:3]), minutes=int(compact[3:5])))
+    return datetime.now(tz).date()
+
+
+def next_check(entry, now):
+    hours = entry.get("refresh_hours", DEFAULT_REFRESH_HOURS)
+    return now + hours * 3600 * (1 + random.uniform(-JITTER_FRACTION, JITTER_FRACTION))
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    once = "--once" in sys.argv[1:]
+    debug("Starting EPG daemon" + (" (single cycle)" if once else ""))
+
+    fetch = load_script(FETCH_SCRIPT)
+    channels = {}
+    for s in CHANNEL_SCRIPTS:
+        if os.path.exists(s):
+            channels[s] = load_script(s)
+        else:
+            debug(f"SKIPPED: {s} (file missing)")
+    stubs = load_script(STUBS_SCRIPT) if os.path.exists(STUBS_SCRIPT) else None
+    packages = {s: load_script(s) for s in PACKAGE_SCRIPTS if os.path.exists(s)}
+    search = load_script(SEARCH_SCRIPT) if os.path.exists(SEARCH_SCRIPT) else None
+    inputs = {s: channel_inputs(m) for s, m in channels.items()}
+
+    state = fetch.load_feed_state()
+    due = {entry["out_xml"]: 0 for entry in fetch.FEEDS}
+    package_sigs = {s: None for s in packages}
+    day = None
+    windows = {s: None for s in channels}
+
+    while True:
+        now = time.time()
+        changed = set()
+        due_now = [entry for entry in fetch.FEEDS if due[entry["out_xml"]] <= now]
+        with ThreadPoolExecutor(max_workers=fetch.FETCH_WORKERS) as pool:
+            updated = pool.map(lambda entry: fetch.fetch_entry(entry, state), due_now)
+            for entry, was_updated in zip(due_now, updated):
+                if was_updated:
+                    changed.add(os.path.normpath(entry["out_xml"]))
+                due[entry["out_xml"]] = next_check(entry, time.time())
+
+        # A new day moves every channel's window (or one of its zones' windows), changed feeds only their readers
+        today = target_date()
+        for s, module in channels.items():
+            current = variant_windows(module)
+            if (today != day or current != windows[s]
+                    or inputs[s] is None and changed or inputs[s] and inputs[s] & changed):
+                run_step(s, module.main)
+            windows[s] = current
+        if stubs is not None and (today != day or changed):
+            run_step(STUBS_SCRIPT, stubs.main)
+        day = today
+
+        rebuilt = False
+        for s, module in packages.items():
+            sig = folder_signature(PACKAGE_SCRIPTS[s])
+            if sig != package_sigs[s]:
+                run_step(s, module.main)
+                rebuilt = True
+                package_sigs[s] = folder_signature(PACKAGE_SCRIPTS[s])
+        if search is not None and rebuilt:
+            run_step(SEARCH_SCRIPT, search.build)
+
+        if once:
+            break
+        wake = min(min(due.values()), time.time() + MAX_SLEEP_SECONDS)
+        debug(f"{len(changed)} feed(s) changed; next check at {datetime.fromtimestamp(wake).strftime('%Y-%m-%d %H:%M:%S')}")
+        time.sleep(max(1.0, wake - time.time()))
+    debug("Daemon stopped")
+
+
+if __name__ == "__main__":
+    main()
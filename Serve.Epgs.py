@@ -0,0 +1,373 @@
+import os
+import re
+import gzip
+import time
+import bisect
+import hashlib
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
+
+from epgcore import NO_TIME, xmltv_epoch
+
+try:
+    import zstandard
+except ImportError:  # optional: zstd variants when available
+    zstandard = None
+
+# ========================
+# Local EPG server for set-top boxes: serves the packages and per-channel guides
+#   /package/myTV.xml         (gzip/zstd by Accept-Encoding)
+#   /package/myTV.xml.gz      (the gzip file itself, as stored on disk)
+#   /channels/Melo-NZ.xml     (also for channels kept only as Melo-NZ.xml.gz)
+#   /package/myTV.xml?channels=Geo-News,ARY-News&from=20260111000000&to=20260112000000
+# Every file is read and compressed once per change (keyed by mtime/size), at startup and by a
+# reload pass every RELOAD_SECONDS, so requests are answered from ready bodies; responses carry
+# strong ETags, answer If-None-Match with 304 and support single byte ranges.
+# Filtered responses are cut from an in-memory per-channel index of the file.
+HOST = "0.0.0.0"
+PORT = 8080
+SERVE_DIRS = ["package", "channels", "nzchannels", "pkchannels"]  # URL prefix == folder name
+CACHE_MAX_AGE = 300  # Seconds clients may reuse a response before revalidating
+FILTER_CACHE_SIZE = 256  # Filtered responses kept (LRU)
+FILTER_PARAMS = ("channels", "from", "to")  # Other query parameters (cache busters, tokens) are ignored
+GZIP_LEVEL = 9
+ZSTD_LEVEL = 19
+RELOAD_SECONDS = 30  # How often changed files are re-read and compressed in the background
+
+_lock = threading.Lock()
+_files = {}  # (path, raw) -> {"sig", "body", "index"}
+_filtered = OrderedDict()  # (path, sig, query) -> body
+
+
+def debug(msg):
+    print(f"[DEBUG] {msg}", flush=True)
+
+
+def parse_query_time(value):
+    # Query times are XMLTV times; "+0500" arrives as " 0500" once the URL is decoded
+    value = value.strip()
+    m = re.fullmatch(r"(\d+)\s+(\d{4})", value)
+    if m:
+        value = f"{m.group(1)} +{m.group(2)}"
+    epoch = xmltv_epoch(value)
+    if epoch == NO_TIME:
+        raise ValueError(f"Unrecognized time: {value}")
+    return epoch
+
+
+class Body:
+    # One response body with its encodings (built on first use unless precompressed) and their strong ETags
+    def __init__(self, data, precompress=False):
+        self.data = data
+        self.digest = hashlib.sha1(data).hexdigest()[:24]
+        self.encoded = {"identity": data}
+        if precompress:
+            for encoding in ("gzip", "zstd") if zstandard is not None else ("gzip",):
+                self.get(encoding)
+
+    def get(self, encoding):
+        if encoding not in self.encoded:
+            if encoding == "gzip":
+                self.encoded["gzip"] = gzip.compress(self.data, GZIP_LEVEL, mtime=0)
+            elif encoding == "zstd":
+                self.encoded["zstd"] = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(self.data)
+        return self.encoded[encoding]
+
+    def etag(self, encoding):
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+
+def build_index(data):
+    # Per channel: the serialized <channel>, and programme starts/stops/bytes sorted by start
+    root = None
+    tv_attrib = {}
+    channel_order = []
+    channels = {}
+    programmes = {}
+    for event, elem in ET.iterparse(BytesIO(data), events=("start", "end")):
+        if root is None:
+            root = elem
+            tv_attrib = dict(elem.attrib)
+            continue
+        if event != "end" or elem.tag not in ("channel", "programme"):
+            continue
+        elem.tail = None
+        if elem.tag == "channel":
+            cid = elem.attrib.get("id")
+            if cid not in channels:
+                channel_order.append(cid)
+            channels[cid] = ET.tostring(elem, encoding="utf-8", xml_declaration=False)
+        else:
+            start = xmltv_epoch(elem.attrib.get("start"))
+            stop = xmltv_epoch(elem.attrib.get("stop"))
+            if start != NO_TIME:
+                programmes.setdefault(elem.attrib.get("channel"), []).append(
+                    (start, stop if stop != NO_TIME else start, ET.tostring(elem, encoding="utf-8", xml_declaration=False)))
+        root.clear()
+    for cid, rows in programmes.items():
+        rows.sort(key=lambda r: r[0])
+        programmes[cid] = ([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows])
+    head = "<?xml version='1.0' encoding='utf-8'?>\n<tv" + "".join(f" {k}={quoteattr(v)}" for k, v in tv_attrib.items()) + ">\n"
+    return {"head": head.encode("utf-8"), "order": channel_order,
+            "channels": channels, "programmes": programmes}
+
+
+def filter_index(index, channel_ids, t_from, t_to):
+    # Programmes overlapping [t_from, t_to) of the wanted channels, in package channel order
+    wanted = [c for c in index["order"] if channel_ids is None or c in channel_ids]
+    parts = [index["head"]]
+    for cid in wanted:
+        parts += [b"  ", index["channels"][cid], b"\n"]
+    for cid in wanted:
+        starts, stops, blobs = index["programmes"].get(cid, ([], [], []))
+        hi = len(starts) if t_to is None else bisect.bisect_left(starts, t_to)
+        # Packages are normalized (no overlaps), so only the programme just before t_from can reach into it
+        lo = 0 if t_from is None else max(0, bisect.bisect_left(starts, t_from) - 1)
+        for i in range(lo, hi):
+            if t_from is None or stops[i] > t_from or starts[i] >= t_from:
+                parts += [b"  ", blobs[i], b"\n"]
+    parts.append(b"</tv>\n")
+    return b"".join(parts)
+
+
+def load_file(path, raw=False):
+    # Cached body of an .xml file, re-read when its mtime or size changes; raw keeps the bytes as
+    # stored (an .xml.gz served as the file itself), otherwise gzip is inflated and the encodings built
+    st = os.stat(path)
+    sig = (st.st_mtime_ns, st.st_size)
+    with _lock:
+        entry = _files.get((path, raw))
+        if entry and entry["sig"] == sig:
+            return entry
+    with open(path, "rb") as f:
+        data = f.read()
+    if not raw and data[:2] == b"\x1f\x8b":
+        # Channel written as <name>.xml.gz only: served (and filtered) from its inflated body
+        data = gzip.decompress(data)
+    # The .gz next to an .xml is not used for its encodings: checkout/copy mtimes cannot tell whether it matches
+    entry = {"sig": sig, "body": Body(data, precompress=not raw), "index": None}
+    with _lock:
+        _files[(path, raw)] = entry
+    debug(f"Loaded {path} ({len(data)} bytes{', as stored' if raw else ''})")
+    return entry
+
+
+def reload_files():
+    # Load new and changed files ahead of their requests; forget removed ones
+    seen = set()
+    for folder in SERVE_DIRS:
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            try:
+                if name.endswith(".xml"):
+                    load_file(path)
+                    seen.add((path, False))
+                elif name.endswith(".xml.gz"):
+                    load_file(path, raw=True)
+                    seen.add((path, True))
+                    if not os.path.isfile(path[:-3]):
+                        load_file(path)
+                        seen.add((path, False))
+            except Exception as e:
+                debug(f"Skipping {path}: {e}")
+    with _lock:
+        for key in set(_files) - seen:
+            del _files[key]
+
+
+def reload_loop():
+    while True:
+        time.sleep(RELOAD_SECONDS)
+        try:
+            reload_files()
+        except Exception as e:
+            debug(f"Reload failed: {e}")
+
+
+def filtered_body(path, entry, query):
+    channels = None
+    if query.get("channels"):
+        channels = {c.strip() for v in query["channels"] for c in v.split(",") if c.strip()}
+    t_from = parse_query_time(query["from"][0]) if query.get("from") else None
+    t_to = parse_query_time(query["to"][0]) if query.get("to") else None
+    key = (path, entry["sig"], tuple(sorted(channels)) if channels else None, t_from, t_to)
+    with _lock:
+        body = _filtered.get(key)
+        if body is not None:
+            _filtered.move_to_end(key)
+            return body
+    if entry["index"] is None:
+        entry["index"] = build_index(entry["body"].data)
+    body = Body(filter_index(entry["index"], channels, t_from, t_to))
+    with _lock:
+        _filtered[key] = body
+        while len(_filtered) > FILTER_CACHE_SIZE:
+            _filtered.popitem(last=False)
+    return body
+
+
+def accepted_encodings(header):
+    # {"gzip", "zstd", ...} accepted with q > 0
+    accepted = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        m = re.search(r"q=([0-9.]+)", params)
+        if m:
+            q = float(m.group(1))
+        if name and q > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def parse_range(header, size):
+    # Single "bytes=a-b" / "bytes=a-" / "bytes=-n" range -> (first, last); None = serve whole body
+    m = re.fullmatch(r"bytes=(\d*)-(\d*)", (header or "").strip())
+    if not m or m.group(1) == m.group(2) == "":
+        return None
+    if m.group(1) == "":
+        length = int(m.group(2))
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    first = int(m.group(1))
+    last = int(m.group(2)) if m.group(2) else size - 1
+    if first >= size or last < first:
+        raise ValueError("unsatisfiable range")
+    return first, min(last, size - 1)
+
+
+class EPGHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "EPGServer/1.0"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def send_plain(self, status, text=""):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        rel = unquote(url.path).lstrip("/")
+        folder, _, name = rel.partition("/")
+        as_gz_file = name.endswith(".xml.gz")
+        if as_gz_file:
+            name = name[:-3]
+        # A plain file name inside a served folder: no separators of either kind, drives or dot files
+        if (folder not in SERVE_DIRS or not name.endswith(".xml") or name.startswith(".")
+                or any(c in name for c in "/\\:") or os.path.isabs(name)):
+            return self.send_plain(404, "Not found\n")
+        path = os.path.join(folder, name)
+        # Only a filter parameter leaves the cached file (and its ETag) for a filtered body
+        query = {k: v for k, v in parse_qs(url.query).items() if k in FILTER_PARAMS}
+        stored_gz = as_gz_file and not query and os.path.isfile(path + ".gz")
+        if stored_gz:
+            # The .gz as stored: no inflate and no second compression
+            entry = load_file(path + ".gz", raw=True)
+            body = entry["body"]
+        else:
+            if not os.path.isfile(path) and os.path.isfile(path + ".gz"):
+                path += ".gz"
+            if not os.path.isfile(path):
+                return self.send_plain(404, "Not found\n")
+            entry = load_file(path)
+            try:
+                body = filtered_body(path, entry, query) if query else entry["body"]
+            except ValueError as e:
+                return self.send_plain(400, f"{e}\n")
+
+        if stored_gz:
+            encoding, content_type, content_encoding = "identity", "application/gzip", None
+        elif as_gz_file:
+            encoding, content_type, content_encoding = "gzip", "application/gzip", None
+        else:
+            accepted = accepted_encodings(self.headers.get("Accept-Encoding"))
+            if "zstd" in accepted and zstandard is not None:
+                encoding = "zstd"
+            elif "gzip" in accepted:
+                encoding = "gzip"
+            else:
+                encoding = "identity"
+            content_type = "application/xml; charset=utf-8"
+            content_encoding = None if encoding == "identity" else encoding
+        etag = body.etag(encoding)
+
+        inm = self.headers.get("If-None-Match")
+        if inm and (inm.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in inm.split(",")]):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", f"max-age={CACHE_MAX_AGE}")
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return
+
+        data = body.get(encoding)
+        status = 200
+        first, last = 0, len(data) - 1
+        range_hdr = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if range_hdr and (not if_range or if_range.strip() == etag):
+            try:
+                rng = parse_range(range_hdr, len(data))
+            except ValueError:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if rng:
+                status = 206
+                first, last = rng
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if content_encoding:
+            self.send_header("Content-Encoding", content_encoding)
+        self.send_header("Content-Length", str(last - first + 1))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", f"max-age={CACHE_MAX_AGE}")
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Last-Modified", time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(entry["sig"][0] / 1e9)))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {first}-{last}/{len(data)}")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data[first:last + 1] if status == 206 else data)
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    debug(f"Serving {', '.join(SERVE_DIRS)} on http://{HOST}:{PORT}/ (zstd={'yes' if zstandard else 'no'})")
+    reload_files()
+    threading.Thread(target=reload_loop, daemon=True).start()
+    server = ThreadingHTTPServer((HOST, PORT), EPGHandler)
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    debug("Server stopped")
+
+
+if __name__ == "__main__":
+    main()
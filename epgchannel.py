@@ -0,0 +1,673 @@
+import os
+import re
+import gzip
+import mmap
+import sys
+import hashlib
+from array import array
+import xml.etree.ElementTree as ET
+from urllib.request import Request, urlopen
+from urllib.parse import urlparse
+from datetime import datetime, timedelta, timezone
+
+import epgcore
+from epgcore import (debug, load_script, lxml_etree, xml_options, file_digest, load_json_state, save_json_state, NO_TIME, NO_OFFSET,
+                     parse_xmltv_time, ProgrammeTable, open_input, escape_text, escape_attr, ZoneOffsets,
+                     snapshot_path_for, snapshot_is_fresh, snapshot_sections, FEED_STATE_PATH, RECENT_FETCH_HOURS,
+                     iter_decompressed, feed_coverage)
+
+# XML backends: ElementTree, and lxml (when installed) only where a single channel is read from a feed,
+# the one case it measured faster (x1.1-1.6, Bench.Xml.py); reading every channel walks each programme
+# in Python through lxml's proxy objects, which is slower (x0.7-0.9)
+XML = ET
+SINGLE_CHANNEL_XML = lxml_etree if lxml_etree is not None else ET
+
+# ========================
+# The single-channel EPG writer behind the *-NZ.py scripts. A channel script only holds its settings
+# (CHANNEL_*, PROGRAMME_*, DAYS_OF_EPG_TO_GENERATE, OUTPUT_FILE_NAME, TARGET_TZ_OFFSET, OUTPUT_VARIANTS,
+# INPUT_URL, COUNTRIES_XML_PATH, CHANNEL_ID_TO_READ, EXTRA_SOURCES) and hands its module to main();
+# every function here that needs them takes that module as `cfg`.
+# EXTRA_SOURCES is empty in every NZ script: NZAU.epg.xml (i.mjh.nz, mjh-* ids) and NZ.epg.xml
+# (epgshare NZ1, <Name>.nz ids) do not carry any of these channels both, so there is no second
+# source to merge. Add an entry once a feed lists one of them under an id of its own.
+
+# Refresh policy: a feed is refetched when the coverage recorded by Fetch.Epgs.py for the channels read
+# ends before the output window does, unless Fetch.Epgs.py fetched it within RECENT_FETCH_HOURS (the
+# server would only send the same programmes again). Without a record the coverage is measured from the
+# file; calendar-date check only when neither holds the channels read.
+# The outputs are rebuilt only when the source contents, the channel script, this engine or the day window changed.
+# A feed listed in FEEDS of this script is refetched through it, so its channel projection,
+# snapshot and feeds.state.json entry stay as Fetch.Epgs.py writes them
+FETCH_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Fetch.Epgs.py")
+EXTRACT_STATE_PATH = os.path.join("channels", "extract.state.json")
+# Every output folder keeps a manifest of its channel files: file -> channel id, fingerprint of the
+# programmes as written, programme count and coverage. A file whose fingerprint did not change is not
+# written again, so the package builder, the search index and git only see the channels that changed.
+MANIFEST_NAME = "manifest.json"
+
+# Byte-level pre-filter for countries XML without a snapshot: <programme> start tags are matched in
+# the raw bytes and only fragments of the wanted channels are handed to the XML parser. Files it
+# cannot cut safely (UTF-16, DTD internal subsets, namespaces, programme tags inside comments or
+# CDATA, odd tag syntax, truncation) are parsed in full as before.
+PREFILTER_PROGRAMMES = True
+PREFILTER_VERIFY = False  # Also run the full parse and keep its result when the two differ
+
+# Outputs are written as <name>.xml.gz only (the package builders read gzip directly);
+# set True to also keep the uncompressed <name>.xml next to it
+WRITE_PLAIN_XML = False
+
+GENERIC_SLOTS = {}  # (duration, zone, window) -> slot starts, shared by every channel script of the process
+
+def ensure_dirs(cfg):
+    # Ensure the countries folders exist (output folders are created as they are written)
+    for d in {os.path.dirname(cfg.COUNTRIES_XML_PATH)} | {os.path.dirname(src["xml"]) for src in cfg.EXTRA_SOURCES}:
+        if d and not os.path.exists(d):
+            debug(f"Creating directory: {d}")
+            os.makedirs(d, exist_ok=True)
+
+def code_digest(cfg):
+    # The channel script and the code writing it: a change to either rebuilds its outputs
+    return hashlib.sha1("".join(file_digest(os.path.abspath(p)) for p in (cfg.__file__, __file__, epgcore.__file__)).encode("ascii")).hexdigest()
+
+def get_server_datetime(url):
+    try:
+        req = Request(url, method="HEAD")
+        with urlopen(req, timeout=30) as resp:
+            date_hdr = resp.headers.get("Date")
+            if date_hdr:
+                return datetime.strptime(date_hdr, "%a, %d %b %Y %H:%M:%S GMT").replace(tzinfo=timezone.utc)
+    except Exception:
+        pass
+    return datetime.now(timezone.utc)
+
+def file_created_today(path, reference_dt_utc):
+    if not os.path.exists(path):
+        return False
+    st = os.stat(path)
+    modified_local = datetime.fromtimestamp(st.st_mtime).astimezone()
+    ref_local = reference_dt_utc.astimezone(modified_local.tzinfo)
+    debug(f"Existing file modified date: {modified_local.date()} | reference date: {ref_local.date()} | path: {path}")
+    return modified_local.date() == ref_local.date()
+
+def feed_needs_refresh(xml_path, source_channel_ids, feed_state, server_dt_utc, window_end):
+    # Decide from the coverage of these channels against the end of the output window: as Fetch.Epgs.py
+    # recorded it, while that record still describes the file, otherwise measured from the file itself
+    # (a fresh checkout has no feeds.state.json); the file date decides only when neither has them.
+    if not os.path.exists(xml_path):
+        debug("Countries XML does not exist; will download.")
+        return True
+    entry = feed_state.get(os.path.basename(xml_path))
+    recorded = bool(entry and entry.get("fetched") and os.stat(xml_path).st_mtime <= entry["fetched"] + 60)
+    if recorded:
+        horizons = [entry.get("channels", {}).get(cid, entry.get("horizon")) for cid in source_channel_ids]
+        horizons = [h for h in horizons if h is not None]
+    else:
+        horizons = list(feed_coverage(xml_path, source_channel_ids).values())
+    if horizons:
+        short_h = (window_end - min(horizons)) / 3600
+        debug(f"{'Recorded' if recorded else 'Measured'} coverage of {', '.join(sorted(source_channel_ids))}: "
+              + (f"ends {short_h:.1f}h before" if short_h > 0 else "covers") + f" the output window | path: {xml_path}")
+        if short_h <= 0:
+            return False
+    if recorded:
+        fetched_h = (server_dt_utc.timestamp() - entry["fetched"]) / 3600
+        if fetched_h < RECENT_FETCH_HOURS:
+            debug(f"Fetched by Fetch.Epgs.py {fetched_h:.1f}h ago; using it as it is.")
+            return False
+    if horizons:
+        return True
+    if file_created_today(xml_path, server_dt_utc):
+        debug("Countries XML is fresh (created today); skip download/extraction.")
+        return False
+    debug("Countries XML exists but is older; will refresh from external source.")
+    return True
+
+def extraction_key(cfg, feeds, variants):
+    # Content hashes rather than mtimes: a fresh checkout touches every file
+    key = {"script": code_digest(cfg),
+           "window": [f"{variant['tz']} {zone.format(window[0])[:8]}" for variant, zone, window in variants],
+           "sources": {}}
+    for xml_path, group in feeds.items():
+        if os.path.exists(xml_path):
+            key["sources"][xml_path] = {"sha1": file_digest(xml_path), "channels": sorted(src["channel"] for src in group)}
+    return key
+
+def outputs_exist(cfg, variants):
+    exts = ("", ".gz") if WRITE_PLAIN_XML else (".gz",)
+    return all(os.path.exists(os.path.join(d, variant.get("file", cfg.OUTPUT_FILE_NAME) + ext))
+               for variant, _, _ in variants for d in variant["dirs"] for ext in exts)
+
+def fetch_feed_entry(xml_path, source_channel_ids):
+    # The FEEDS entry of Fetch.Epgs.py writing xml_path (its projection widened to the channels
+    # read here) and the loaded script, or (None, None) when it does not list the feed
+    fetch = sys.modules.get("Fetch_Epgs")
+    if fetch is None:
+        if not os.path.exists(FETCH_SCRIPT):
+            return None, None
+        fetch = load_script(FETCH_SCRIPT)
+    for entry in fetch.FEEDS:
+        if os.path.normpath(entry["out_xml"]) == os.path.normpath(xml_path):
+            if entry.get("channels"):
+                entry = dict(entry, channels=sorted(set(entry["channels"]) | set(source_channel_ids)))
+            return fetch, entry
+    return None, None
+
+def refresh_feed(url, xml_path, source_channel_ids, feed_state):
+    # Returns a <tv> root of the wanted programmes when the feed was parsed here, None when
+    # Fetch.Epgs.py (re)wrote the file and its snapshot, which are then read as usual
+    fetch, entry = fetch_feed_entry(xml_path, source_channel_ids)
+    if entry is None:
+        return download_or_extract_input(url, xml_path, source_channel_ids)
+    debug(f"Refreshing through Fetch.Epgs.py: {xml_path}")
+    fetch.fetch_entry(entry, feed_state)
+    return None
+
+def xml_for(source_channel_ids):
+    return SINGLE_CHANNEL_XML if len(source_channel_ids) == 1 else XML
+
+def download_or_extract_input(url, out_xml_path, source_channel_ids):
+    # For feeds Fetch.Epgs.py does not list: the feed is parsed while it downloads and saved
+    # whole; returns a <tv> root holding only the programmes of source_channel_ids.
+    parsed = urlparse(url)
+    is_gz = parsed.path.endswith(".xml.gz")
+    debug(f"Streaming: {url} | gzip={is_gz} | into: {out_xml_path}")
+    req = Request(url, headers={"User-Agent": "Mozilla/5.0 (Generic Channel Fetch)"})
+    xml = xml_for(source_channel_ids)
+    parser = xml.XMLPullParser(events=("start", "end"), **xml_options(xml))
+    kept = xml.Element("tv")
+    root = None
+    tmp_path = out_xml_path + ".part"
+    with urlopen(req, timeout=120) as resp, open(tmp_path, "wb") as f:
+        for _, data in iter_decompressed(resp, is_gz):
+            f.write(data)
+            parser.feed(data)
+            for event, elem in parser.read_events():
+                if root is None:
+                    root = elem
+                    continue
+                if event != "end" or elem.tag not in ("channel", "programme"):
+                    continue
+                if elem.tag == "programme" and elem.attrib.get("channel") in source_channel_ids:
+                    kept.append(elem)
+                root.clear()
+        parser.close()
+    os.replace(tmp_path, out_xml_path)
+    debug(f"Extracted {len(kept)} programmes for {', '.join(sorted(source_channel_ids))} while downloading")
+    return kept
+
+def output_variants(cfg, server_dt_utc):
+    # (variant, zone, window) for every usable entry of the channel's OUTPUT_VARIANTS
+    now = int(server_dt_utc.timestamp())
+    variants = []
+    for variant in cfg.OUTPUT_VARIANTS:
+        try:
+            zone = ZoneOffsets(variant["tz"])
+        except Exception as e:
+            debug(f"Skipping output variant {variant['tz']}: {e}")
+            continue
+        variants.append((variant, zone, zone.days_window(now, cfg.DAYS_OF_EPG_TO_GENERATE)))
+    return variants
+
+def add_programme_element(cfg, prog, table):
+    start, _, _ = parse_xmltv_time(prog.attrib.get("start"))
+    if start == NO_TIME:
+        return
+    stop, _, _ = parse_xmltv_time(prog.attrib.get("stop"))
+    title_el = prog.find("title"); sub_el = prog.find("sub-title"); desc_el = prog.find("desc")
+    title = title_el.text.strip() if (title_el is not None and title_el.text) else cfg.PROGRAMME_TITLE
+    sub = sub_el.text.strip() if (sub_el is not None and sub_el.text) else cfg.PROGRAMME_SUBTITLE
+    desc = desc_el.text.strip() if (desc_el is not None and desc_el.text) else cfg.PROGRAMME_DESCRIPTION
+    table.add(prog.attrib.get("channel"), start, stop, NO_OFFSET, title, sub, desc)
+
+def read_programmes_from_root(cfg, root, source_channel_ids, table):
+    for prog in root.findall("programme"):
+        if prog.attrib.get("channel") in source_channel_ids:
+            add_programme_element(cfg, prog, table)
+    return table
+
+PREFILTER_OPEN_RE = re.compile(rb"<programme(?=[\s/>])")
+PREFILTER_TAG_RE = re.compile(rb"""<programme((?:\s+[^\s=/>]+\s*=\s*(?:"[^"]*"|'[^']*'))*)\s*(/?)>""")
+PREFILTER_CHANNEL_RE = re.compile(rb"""\schannel\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+PREFILTER_END_RE = re.compile(rb"</programme\s*>")
+PREFILTER_NORMALIZED_RE = re.compile(rb"[&\t\n\r]")  # attribute values the parser would rewrite
+PREFILTER_ESCAPED_RE = re.compile(rb"[&<>\"'\t\n\r]")  # ids that would not appear verbatim
+PREFILTER_CHARREF_VALUE_RE = re.compile(rb' channel="[^"]*&#')
+PREFILTER_WHITESPACE_VALUE_RE = re.compile(rb' channel="[^"]*[\t\n\r]')
+PREFILTER_HIDDEN_RE = re.compile(rb"<!--.*?-->|<!\[CDATA\[.*?\]\]>", re.S)
+PREFILTER_ENCODING_RE = re.compile(rb"""^(?:\xef\xbb\xbf)?<\?xml[^>]*?\sencoding\s*=\s*["']([A-Za-z0-9._-]+)["']""")
+
+def prefilter_spans_by_channel(data, wanted):
+    # Feeds writing every programme as <programme ... channel="X"...>: jump straight to the wanted
+    # channel attributes (bytes.find) and back to their tag; the other programmes are never looked at.
+    # Values the parser could rewrite into a wanted id (character references, or whitespace for ids
+    # with a space) are kept for it to decide; named entities only yield characters no id here has.
+    hits = []
+    for value in wanted:
+        needle = b' channel="' + value + b'"'
+        pos = data.find(needle)
+        while pos >= 0:
+            hits.append(pos)
+            pos = data.find(needle, pos + len(needle))
+    if data.find(b"&#") >= 0:
+        hits.extend(m.start() for m in PREFILTER_CHARREF_VALUE_RE.finditer(data))
+    if any(b" " in value for value in wanted):
+        hits.extend(m.start() for m in PREFILTER_WHITESPACE_VALUE_RE.finditer(data))
+    spans = set()
+    for pos in hits:
+        start = data.rfind(b"<", 0, pos)
+        tag = PREFILTER_TAG_RE.match(data, start)
+        if tag is None or tag.end() <= pos:
+            if data[start:start + 11].rstrip(b" \t\r\n/>") == b"<programme":
+                return None
+            continue  # text that merely looks like the attribute
+        end = tag.end()
+        if not tag.group(2):
+            m = PREFILTER_END_RE.search(data, tag.end())
+            if m is None:
+                return None
+            end = m.end()
+        spans.add((start, end))
+    return sorted(spans)
+
+def prefilter_spans_by_tag(data, wanted):
+    # Any other attribute layout: every <programme> start tag is matched and its channel checked
+    spans = []
+    for m in PREFILTER_OPEN_RE.finditer(data):
+        tag = PREFILTER_TAG_RE.match(data, m.start())
+        if tag is None:
+            return None
+        ch = PREFILTER_CHANNEL_RE.search(tag.group(1))
+        if ch is None:
+            continue
+        value = ch.group(1) if ch.group(1) is not None else ch.group(2)
+        if value not in wanted and not PREFILTER_NORMALIZED_RE.search(value):
+            continue
+        if tag.group(2):
+            spans.append((m.start(), tag.end()))
+            continue
+        end = PREFILTER_END_RE.search(data, tag.end())
+        if end is None:
+            return None
+        spans.append((m.start(), end.end()))
+    return spans
+
+def prefilter_programmes(data, source_channel_ids):
+    # Root of a small document with only the <programme> fragments that may belong to the wanted
+    # channels (the parsed attributes decide); None when the bytes cannot be cut without the parser
+    if data[:2] in (b"\xff\xfe", b"\xfe\xff") or not data[-64:].rstrip().endswith(b"</tv>"):
+        return None
+    m = PREFILTER_ENCODING_RE.match(data[:256])
+    encoding = m.group(1) if m else b"utf-8"
+    if encoding.lower().startswith((b"utf-16", b"utf-32", b"ucs")):
+        return None
+    xml = xml_for(source_channel_ids)
+    first = PREFILTER_OPEN_RE.search(data)
+    if first is None:
+        return xml.fromstring(b"<tv />")
+    prolog = data[:first.start()]
+    if b"xmlns" in prolog or re.search(rb"<!DOCTYPE[^>\[]*\[", prolog):
+        return None
+    markup = data.find(b"<!")
+    if markup >= 0 and data.startswith(b"<!DOCTYPE", markup):
+        markup = data.find(b"<!", markup + 2)
+    if markup >= 0 and any(b"programme" in h.group(0) for h in PREFILTER_HIDDEN_RE.finditer(data, markup)):
+        return None
+    wanted = {cid.encode("utf-8") for cid in source_channel_ids}
+    # One ' channel="' per programme tag and ids that need no escaping: the channel needles find them all
+    if data.count(b"<programme") == data.count(b' channel="') and not any(PREFILTER_ESCAPED_RE.search(v) for v in wanted):
+        spans = prefilter_spans_by_channel(data, wanted)
+    else:
+        spans = prefilter_spans_by_tag(data, wanted)
+    if spans is None:
+        return None
+    parts = [b'<?xml version="1.0" encoding="' + encoding + b'"?><tv>']
+    parts.extend(data[a:b] for a, b in spans)
+    parts.append(b"</tv>")
+    return xml.fromstring(b"".join(parts), xml.XMLParser(**xml_options(xml)))
+
+def table_rows(table):
+    return [(table.channels[table.channel[i]], table.start[i], table.stop[i], table.text(table.title[i]),
+             table.text(table.sub[i]), table.text(table.desc[i])) for i in range(len(table))]
+
+def read_programmes_from_file(cfg, xml_path, source_channel_ids, table):
+    # Pre-filtered fragments when the file allows it, else the full streaming pass
+    if PREFILTER_PROGRAMMES:
+        root = None
+        try:
+            with open(xml_path, "rb") as f:
+                data = f.read()
+            if data[:2] == b"\x1f\x8b":
+                data = gzip.decompress(data)
+            root = prefilter_programmes(data, source_channel_ids)
+        except Exception as e:
+            debug(f"Pre-filter failed on {xml_path} ({e})")
+            root = None
+        if root is not None:
+            read_programmes_from_root(cfg, root, source_channel_ids, table)
+            if PREFILTER_VERIFY:
+                full = stream_programmes_from_file(cfg, xml_path, source_channel_ids, ProgrammeTable())
+                if table_rows(full) != table_rows(table):
+                    debug(f"Pre-filter result differs from the full parse of {xml_path}; using the full parse")
+                    return full
+            return table
+        debug(f"Pre-filter not applicable to {xml_path}; parsing it in full")
+    return stream_programmes_from_file(cfg, xml_path, source_channel_ids, table)
+
+def stream_programmes_from_file(cfg, xml_path, source_channel_ids, table):
+    # Single streaming pass over the countries XML for every wanted channel id
+    root = None
+    xml = xml_for(source_channel_ids)
+    with open_input(xml_path) as f:
+        if xml is not ET:
+            # lxml hands over the <programme> elements only; finished siblings are dropped as it goes
+            for event, elem in xml.iterparse(f, events=("end",), tag="programme", **xml_options(xml)):
+                if elem.attrib.get("channel") in source_channel_ids:
+                    add_programme_element(cfg, elem, table)
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+            return table
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if root is None:
+                root = elem
+                continue
+            if event != "end" or elem.tag not in ("channel", "programme"):
+                continue
+            if elem.tag == "programme" and elem.attrib.get("channel") in source_channel_ids:
+                add_programme_element(cfg, elem, table)
+            root.clear()
+    return table
+
+def read_snapshot_column(mm, sections, name, typecode, lo, hi):
+    # Copy only rows lo:hi of one column out of the mapped file
+    off, _ = sections[name]
+    col = array(typecode)
+    col.frombytes(mm[off + lo * col.itemsize: off + hi * col.itemsize])
+    return col
+
+def read_programmes_from_snapshot(cfg, snap_path, source_channel_id, table):
+    # Load one channel's rows from a memory-mapped snapshot (written by Fetch.Epgs.py); other channels are never touched
+    with open(snap_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        sections = snapshot_sections(mm, snap_path)
+        n_channels = sections["chan_offsets"][1] // 8 - 1
+        chan_offsets = read_snapshot_column(mm, sections, "chan_offsets", "Q", 0, n_channels + 1)
+        blob_off = sections["chan_blob"][0]
+        key = source_channel_id.encode("utf-8")
+        idx = next((i for i in range(n_channels) if mm[blob_off + chan_offsets[i]: blob_off + chan_offsets[i + 1]] == key), None)
+        if idx is None:
+            return table
+        lo, hi = read_snapshot_column(mm, sections, "chan_rows", "Q", idx, idx + 2)
+        starts = read_snapshot_column(mm, sections, "start", "q", lo, hi)
+        stops = read_snapshot_column(mm, sections, "stop", "q", lo, hi)
+        titles = read_snapshot_column(mm, sections, "title", "i", lo, hi)
+        subs = read_snapshot_column(mm, sections, "sub", "i", lo, hi)
+        desc_offsets = read_snapshot_column(mm, sections, "desc_offsets", "Q", lo, hi + 1)
+        desc_base = sections["desc_blob"][0]
+        # Snapshots written before "desc_set" cannot tell a blank <desc> from none; both take the default
+        desc_set = read_snapshot_column(mm, sections, "desc_set", "b", lo, hi) if "desc_set" in sections else None
+        str_base = sections["str_blob"][0]
+        strings = {}
+
+        def string_at(sid, fallback):
+            if sid < 0:
+                return fallback
+            if sid not in strings:
+                a, b = read_snapshot_column(mm, sections, "str_offsets", "Q", sid, sid + 2)
+                strings[sid] = mm[str_base + a: str_base + b].decode("utf-8")
+            return strings[sid]
+
+        for i in range(hi - lo):
+            if starts[i] == NO_TIME:
+                continue
+            desc = mm[desc_base + desc_offsets[i]: desc_base + desc_offsets[i + 1]].decode("utf-8")
+            if not (desc_set[i] if desc_set is not None else desc):
+                desc = cfg.PROGRAMME_DESCRIPTION
+            table.add(
+                source_channel_id, starts[i], stops[i], NO_OFFSET,
+                string_at(titles[i], cfg.PROGRAMME_TITLE), string_at(subs[i], cfg.PROGRAMME_SUBTITLE), desc,
+            )
+    return table
+
+def collect_programmes_for_days(cfg, table, source_channel_id, window):
+    # Programmes starting in the [from, to) window, start-sorted, missing stops filled
+    window_from, window_to = window
+    items = table.take(table.order(table.select(source_channel_id, window_from, window_to)))
+    starts, stops = items.start, items.stop
+    for i in range(len(items)):
+        if stops[i] == NO_TIME:
+            if i + 1 < len(items):
+                stops[i] = starts[i + 1]
+            else:
+                stops[i] = starts[i] + cfg.PROGRAMMES_DURATION_MIN * 60
+    return items
+
+def richness(cfg, table, i):
+    # Number of fields that carry real data rather than this channel's generic text
+    return ((table.text(table.title[i]) != cfg.PROGRAMME_TITLE) + (table.text(table.sub[i]) != cfg.PROGRAMME_SUBTITLE)
+            + (table.text(table.desc[i]) != cfg.PROGRAMME_DESCRIPTION))
+
+def merge_sources(cfg, candidates):
+    # candidates: [(name, table)] in priority order, each start-sorted with stops filled.
+    # One sweep over the timeline: at every point the sources whose current programme covers
+    # it compete on richness, then total coverage, then list order. Linear in the programmes.
+    if len(candidates) == 1:
+        name, table = candidates[0]
+        return table, [name] * len(table)
+    coverage = [sum(t.stop[i] - t.start[i] for i in range(len(t))) for _, t in candidates]
+    pos = [0] * len(candidates)
+    out = ProgrammeTable()
+    winners = []
+    pending = [t.start[0] for _, t in candidates if len(t)]
+    now = min(pending) if pending else None
+    while now is not None:
+        live = []
+        upcoming = []
+        for k, (_, t) in enumerate(candidates):
+            while pos[k] < len(t) and t.stop[pos[k]] <= now:
+                pos[k] += 1
+            if pos[k] < len(t):
+                if t.start[pos[k]] <= now:
+                    live.append(k)
+                else:
+                    upcoming.append(t.start[pos[k]])
+        if not live:
+            now = min(upcoming) if upcoming else None
+            continue
+        k = max(live, key=lambda k: (richness(cfg, candidates[k][1], pos[k]), coverage[k], -k))
+        name, t = candidates[k]
+        i = pos[k]
+        out.add(cfg.CHANNEL_ID, max(now, t.start[i]), t.stop[i], NO_OFFSET,
+                t.text(t.title[i]), t.text(t.sub[i]), t.text(t.desc[i]))
+        winners.append(name)
+        now = t.stop[i]
+    summary = ", ".join(f"{name}: {winners.count(name)}" for name, _ in candidates)
+    debug(f"Merged {len(candidates)} sources into {len(out)} slots ({summary})")
+    return out, winners
+
+def source_runs(table, winners):
+    # The winners of merge_sources as runs of consecutive slots: [source, start of the first slot, slots]
+    runs = []
+    for i, name in enumerate(winners):
+        if runs and runs[-1][0] == name:
+            runs[-1][2] += 1
+        else:
+            runs.append([name, table.start[i], 1])
+    return runs
+
+def generic_slot_starts(cfg, zone, window):
+    # Generic slots from local midnight of every day in the window (DST days have 23 or 25 hours);
+    # the window fixes the base date and the number of days, so channels alike reuse one template
+    key = (cfg.PROGRAMMES_DURATION_MIN, zone.spec, window)
+    if key not in GENERIC_SLOTS:
+        step = max(1, cfg.PROGRAMMES_DURATION_MIN) * 60
+        starts = array("q")
+        day_start = window[0]
+        while day_start < window[1]:
+            day = datetime.fromtimestamp(day_start + zone.offset_at(day_start) * 60, timezone.utc).date()
+            day_end = zone.midnight(day + timedelta(days=1))
+            starts.extend(range(day_start, day_start + (day_end - day_start) // step * step, step))
+            day_start = day_end
+        GENERIC_SLOTS[key] = starts
+    return GENERIC_SLOTS[key]
+
+def generic_programmes(cfg, zone, window):
+    # Lazy generic schedule: (start, stop, title, sub-title, desc) rows over the cached slot starts
+    length = cfg.PROGRAMMES_DURATION_MIN * 60
+    for s in generic_slot_starts(cfg, zone, window):
+        yield s, s + length, cfg.PROGRAMME_TITLE, cfg.PROGRAMME_SUBTITLE, cfg.PROGRAMME_DESCRIPTION
+
+def render_document(channel_id, header, rows, zone, digest, skip_empty=False):
+    # The XMLTV document streamed from (start, stop, title, sub-title, desc) rows after the <channel>
+    # header (as indent_xml leaves it inside <tv>), times in zone, byte-identical to the old tree +
+    # indent_xml output. Bodies and times are memoized: the generic schedule repeats one body, and a
+    # stop is usually the next programme's start. digest is a sha256 already holding whatever else the
+    # document depends on; skip_empty leaves out empty sub-titles and descs instead of writing "<desc />".
+    # Returns (document bytes, manifest entry: fingerprint, programme count, first start and latest stop)
+    def leaf(tag, text):
+        return f"\n    <{tag}>{escape_text(text)}</{tag}>" if text else f"\n    <{tag} />"
+
+    def optional(tag, text):
+        return "" if skip_empty and not text else leaf(tag, text)
+
+    cid = escape_attr(channel_id)
+    parts = [header]
+    bodies = {}
+    times = {}
+    first = horizon = None
+    for start, stop, title, sub, desc in rows:
+        digest.update(repr((start, stop, title, sub, desc)).encode("utf-8"))
+        body = bodies.get((title, sub, desc))
+        if body is None:
+            body = bodies[(title, sub, desc)] = f"{leaf('title', title)}{optional('sub-title', sub)}{optional('desc', desc)}\n  </programme>"
+        if start not in times:
+            times[start] = zone.format(start)
+        if stop not in times:
+            times[stop] = zone.format(stop)
+        if first is None or start < first:
+            first = start
+        if stop != NO_TIME and (horizon is None or stop > horizon):
+            horizon = stop
+        parts.append(f'<programme channel="{cid}" start="{times[start]}" stop="{times[stop]}">{body}')
+    data = ("<?xml version='1.0' encoding='utf-8'?>\n<tv>\n  " + "".join(parts) + "\n</tv>").encode("utf-8")
+    return data, {"channel": channel_id, "sha256": digest.hexdigest(), "programmes": len(parts) - 1, "from": first, "to": horizon}
+
+def render_channel_document(cfg, rows, zone):
+    # render_document under the channel of cfg, fingerprinting the code, channel and zone with the rows
+    header = (f'<channel id="{escape_attr(cfg.CHANNEL_ID)}">\n    '
+              + (f"<display-name>{escape_text(cfg.CHANNEL_NAME)}</display-name>" if cfg.CHANNEL_NAME else "<display-name />")
+              + f'\n    <icon src="{escape_attr(cfg.CHANNEL_LOGO)}" />\n  </channel>')
+    digest = hashlib.sha256(repr((code_digest(cfg), cfg.CHANNEL_ID, cfg.CHANNEL_NAME, cfg.CHANNEL_LOGO, zone.spec)).encode("utf-8"))
+    return render_document(cfg.CHANNEL_ID, header, rows, zone, digest)
+
+def write_channel_file(data, out_xml):
+    # <name>.xml.gz with a zero gzip timestamp, so unchanged programmes give an unchanged file;
+    # a leftover uncompressed twin is removed unless WRITE_PLAIN_XML keeps it in step
+    with open(out_xml + ".gz", "wb") as f:
+        f.write(gzip.compress(data, 9, mtime=0))
+    if WRITE_PLAIN_XML:
+        with open(out_xml, "wb") as f:
+            f.write(data)
+    elif os.path.exists(out_xml):
+        os.remove(out_xml)
+
+def write_outputs(cfg, rows, variant, zone):
+    # XMLTV document streamed from the rows, times in the variant's zone; returns (programmes, latest stop)
+    data, entry = render_channel_document(cfg, rows, zone)
+
+    # Same document into every folder of the variant, unless the folder's manifest already lists it
+    name = variant.get("file", cfg.OUTPUT_FILE_NAME)
+    for d in variant["dirs"]:
+        os.makedirs(d, exist_ok=True)
+        out_xml = os.path.join(d, name)
+        manifest_path = os.path.join(d, MANIFEST_NAME)
+        manifest = load_json_state(manifest_path)
+        if (manifest.get(name, {}).get("sha256") == entry["sha256"] and os.path.exists(out_xml + ".gz")
+                and os.path.exists(out_xml) == WRITE_PLAIN_XML):
+            debug(f"Unchanged {out_xml}.gz (fingerprint {entry['sha256'][:12]}) | {variant['tz']}")
+            continue
+        write_channel_file(data, out_xml)
+        manifest[name] = entry
+        save_json_state(manifest_path, manifest, indent=1, sort_keys=True)
+        debug(f"Wrote {out_xml}.gz" + (" (+ .xml)" if WRITE_PLAIN_XML else "") + f" | {variant['tz']}")
+    return entry["programmes"], entry["to"]
+
+def main(cfg):
+    # One run of the channel script cfg (its module)
+    debug(f"Starting {cfg.CHANNEL_ID} EPG with check")
+    server_dt_utc = get_server_datetime(cfg.INPUT_URL)
+    ensure_dirs(cfg)
+    sources = [{"url": cfg.INPUT_URL, "xml": cfg.COUNTRIES_XML_PATH, "channel": cfg.CHANNEL_ID_TO_READ}] + cfg.EXTRA_SOURCES
+    feeds = {}
+    for src in sources:
+        feeds.setdefault(src["xml"], []).append(src)
+    variants = output_variants(cfg, server_dt_utc)
+    if not variants:
+        debug("No usable output variant; nothing to write")
+        return
+    # One extraction covering the windows of all variants
+    window = (min(w[0] for _, _, w in variants), max(w[1] for _, _, w in variants))
+    feed_state = load_json_state(FEED_STATE_PATH)
+    roots = {}
+    for xml_path, group in feeds.items():
+        channel_ids = {src["channel"] for src in group}
+        if feed_needs_refresh(xml_path, channel_ids, feed_state, server_dt_utc, window[1]):
+            roots[xml_path] = refresh_feed(group[0]["url"], xml_path, channel_ids, feed_state)
+    extract_state = load_json_state(EXTRACT_STATE_PATH)
+    key = extraction_key(cfg, feeds, variants)
+    previous = extract_state.get(cfg.OUTPUT_FILE_NAME, {})
+    if previous.get("key") == key and outputs_exist(cfg, variants):
+        debug(f"Sources, script and window unchanged since last run; keeping {cfg.OUTPUT_FILE_NAME}")
+        debug("Completed")
+        return
+    candidates = []
+    for xml_path, group in feeds.items():
+        channel_ids = {src["channel"] for src in group}
+        root = roots.get(xml_path)
+        if root is None and not os.path.exists(xml_path):
+            continue
+        try:
+            table = None
+            snap_path = snapshot_path_for(xml_path)
+            if root is None and sys.byteorder == "little" and snapshot_is_fresh(snap_path, xml_path):
+                try:
+                    table = ProgrammeTable()
+                    for cid in channel_ids:
+                        read_programmes_from_snapshot(cfg, snap_path, cid, table)
+                    debug(f"Read {len(table)} programmes from snapshot: {snap_path}")
+                except Exception as e:
+                    debug(f"Snapshot unreadable, parsing countries XML instead: {e}")
+                    table = None
+            if table is None:
+                if root is not None:
+                    table = read_programmes_from_root(cfg, root, channel_ids, ProgrammeTable())
+                else:
+                    table = read_programmes_from_file(cfg, xml_path, channel_ids, ProgrammeTable())
+            for src in group:
+                items = collect_programmes_for_days(cfg, table, src["channel"], window)
+                if len(items):
+                    candidates.append((f"{os.path.basename(xml_path)}:{src['channel']}", items))
+        except Exception as e:
+            debug(f"Failed reading countries XML {xml_path}, skipping its sources: {e}")
+    entries, winners = merge_sources(cfg, candidates) if candidates else (None, [])
+    if not entries:
+        debug("Using generic fallback programmes")
+    stops = []
+    written = 0
+    for variant, zone, variant_window in variants:
+        if entries:
+            part = entries.take(entries.select(None, variant_window[0], variant_window[1]))
+            rows = ((part.start[i], part.stop[i], part.text(part.title[i]), part.text(part.sub[i]),
+                     part.text(part.desc[i])) for i in range(len(part)))
+        else:
+            rows = generic_programmes(cfg, zone, variant_window)
+        count, horizon = write_outputs(cfg, rows, variant, zone)
+        if horizon is not None:
+            stops.append(horizon)
+        written = max(written, count)
+    extract_state = load_json_state(EXTRACT_STATE_PATH)
+    # "sources" keeps which source each merged slot came from (see source_runs)
+    extract_state[cfg.OUTPUT_FILE_NAME] = {"key": key, "programmes": written, "horizon": max(stops) if stops else None,
+                                           "generic": not candidates,
+                                           "sources": source_runs(entries, winners) if entries else []}
+    save_json_state(EXTRACT_STATE_PATH, extract_state, indent=1, sort_keys=True)
+    debug("Completed")
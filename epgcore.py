@@ -0,0 +1,550 @@
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import zlib
+import bisect
+import struct
+import hashlib
+import calendar
+import importlib.util
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import xml.etree.ElementTree as ET
+
+try:
+    import numpy as np
+except ImportError:  # optional: vectorized select/order when available
+    np = None
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # optional: C parser/serializer when available (same output bytes)
+    lxml_etree = None
+
+try:
+    import pytz
+except ImportError:  # optional: named (DST-aware) zones in the channel scripts' OUTPUT_VARIANTS
+    pytz = None
+
+# ========================
+# Code shared by the pipeline scripts (imported by them, never run on its own): XMLTV times, the
+# columnar programme table, input and escaping helpers, parallel gzip, zone offsets, the snapshot
+# format of Fetch.Epgs.py / EpgQuery.py and the small JSON state files.
+# Package .gz files are deflated in GZIP_BLOCK_SIZE blocks on GZIP_WORKERS threads (zlib releases the GIL).
+# Every block is primed with the 32 KiB before it, so the result is one ordinary gzip member.
+GZIP_BLOCK_SIZE = 1024 * 1024
+GZIP_WORKERS = os.cpu_count() or 1
+STREAM_CHUNK_SIZE = 256 * 1024  # Bytes read from the socket per step while streaming a feed
+
+# Coverage horizons and cache validators of every feed, written by Fetch.Epgs.py and read by the
+# channel scripts; a feed fetched within RECENT_FETCH_HOURS is not refetched for short coverage alone
+FEED_STATE_PATH = os.path.join("countries", "feeds.state.json")
+RECENT_FETCH_HOURS = 6
+
+NO_TIME = -(2 ** 63)  # start/stop value for a missing or unparseable time
+NO_OFFSET = -32768  # offset value for a time written without a UTC offset
+XMLTV_TIME_RE = re.compile(r"^(\d{8}|\d{10}|\d{12}|\d{14})(?:\s*([+-])(\d{2})(\d{2}))?$")
+
+# Snapshot layout (little-endian): magic, section count, then (offset, length) per section.
+# Rows are sorted by (channel, start); chan_rows[i]:chan_rows[i+1] is the row range of channel i.
+# New sections go at the end: older snapshots list fewer sections and their readers ignore the extra ones.
+SNAPSHOT_MAGIC = b"EPGSNAP1"
+SNAPSHOT_SECTIONS = ("chan_offsets", "chan_blob", "chan_rows", "start", "stop", "title", "sub",
+                     "str_offsets", "str_blob", "desc_offsets", "desc_blob", "desc_set")
+
+
+def debug(msg):
+    print(f"[DEBUG] {msg}")
+
+
+def load_script(path, name=None):
+    # Import a pipeline script by file name (they are not valid module names); main() is not run.
+    # The module is registered under its name, so the script can find itself in sys.modules.
+    name = name or os.path.splitext(os.path.basename(path))[0].replace("-", "_").replace(".", "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def xml_options(xml):
+    # lxml parser settings matching expat: internal entities only, no size limits
+    return {} if xml is ET else {"resolve_entities": "internal", "huge_tree": True}
+
+
+def ensure_dir(path):
+    # Create the folder holding path
+    d = os.path.dirname(path)
+    if d and not os.path.exists(d):
+        os.makedirs(d, exist_ok=True)
+
+
+def file_digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_json_state(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        debug(f"Ignoring unreadable {path}: {e}")
+        return {}
+
+
+def save_json_state(path, state, **options):
+    # Written next to the target and moved over it, so readers never see half a file
+    ensure_dir(path)
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump(state, f, **options)
+    os.replace(path + ".part", path)
+
+
+def parse_xmltv_time(value):
+    # "20260111000000 +0500" -> (epoch seconds, offset minutes, digits); XMLTV allows
+    # dropping trailing fields, so the digit count is kept to write the value back as-is.
+    # A value without an offset is UTC; one that does not parse is NO_TIME.
+    m = XMLTV_TIME_RE.match(value.strip()) if value else None
+    if not m:
+        return NO_TIME, NO_OFFSET, 14
+    digits, sign, off_h, off_m = m.groups()
+    full = digits.ljust(14, "0")
+    offset = 0 if sign is None else (1 if sign == "+" else -1) * (int(off_h) * 60 + int(off_m))
+    epoch = calendar.timegm((int(full[0:4]), int(full[4:6]), int(full[6:8]), int(full[8:10]), int(full[10:12]), int(full[12:14]), 0, 0, 0)) - offset * 60
+    return epoch, (NO_OFFSET if sign is None else offset), len(digits)
+
+
+def xmltv_epoch(value):
+    # Epoch seconds of an XMLTV time, NO_TIME when missing or unreadable
+    return parse_xmltv_time(value)[0]
+
+
+def format_xmltv_time(epoch, offset, digits=14):
+    if epoch == NO_TIME:
+        return None
+    if offset == NO_OFFSET:
+        return time.strftime("%Y%m%d%H%M%S", time.gmtime(epoch))[:digits]
+    sign = "+" if offset >= 0 else "-"
+    return f"{time.strftime('%Y%m%d%H%M%S', time.gmtime(epoch + offset * 60))[:digits]} {sign}{abs(offset) // 60:02d}{abs(offset) % 60:02d}"
+
+
+def format_display_time(epoch, offset_str):
+    # "2026-01-11 20:30" in a fixed offset such as "+05:00"
+    if epoch == NO_TIME:
+        return "?"
+    compact = offset_str.replace(":", "")
+    offset = (1 if compact.startswith("+") else -1) * (int(compact[1:3]) * 60 + int(compact[3:5]))
+    return time.strftime("%Y-%m-%d %H:%M", time.gmtime(epoch + offset * 60))
+
+
+class ProgrammeTable:
+    # Column-oriented programme store: one typed array per field and every string interned
+    # once, so a programme costs a few dozen bytes instead of a dict of datetimes and strings.
+    # channel holds indexes into self.channels; title/sub/desc hold ids into self.strings (-1 = none).
+    # offset/digits describe how the source wrote its times, so they can be reproduced exactly;
+    # a start/stop that does not parse is NO_TIME with its source text in raw_start/raw_stop.
+    COLUMNS = (("channel", "i"), ("start", "q"), ("stop", "q"), ("offset", "h"), ("digits", "b"),
+               ("title", "i"), ("sub", "i"), ("desc", "i"), ("raw_start", "i"), ("raw_stop", "i"))
+
+    def __init__(self):
+        self.channels = []
+        self.channel_ids = {}
+        self.strings = []
+        self.string_ids = {}
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, array(typecode))
+
+    def __len__(self):
+        return len(self.start)
+
+    def channel_index(self, channel_id):
+        idx = self.channel_ids.get(channel_id)
+        if idx is None:
+            idx = self.channel_ids[channel_id] = len(self.channels)
+            self.channels.append(channel_id)
+        return idx
+
+    def intern(self, text):
+        if text is None:
+            return -1
+        sid = self.string_ids.get(text)
+        if sid is None:
+            sid = self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return sid
+
+    def text(self, sid):
+        return self.strings[sid] if sid >= 0 else None
+
+    def add(self, channel_id, start, stop, offset, title, sub, desc, digits=14, raw_start=None, raw_stop=None):
+        self.channel.append(self.channel_index(channel_id))
+        self.start.append(start)
+        self.stop.append(stop)
+        self.offset.append(offset)
+        self.digits.append(digits)
+        self.title.append(self.intern(title))
+        self.sub.append(self.intern(sub))
+        self.desc.append(self.intern(desc))
+        self.raw_start.append(self.intern(raw_start))
+        self.raw_stop.append(self.intern(raw_stop))
+
+    def column(self, name):
+        # numpy view of a column over the array's own buffer (no copy); only valid until the column grows
+        col = getattr(self, name)
+        return np.frombuffer(col, dtype=col.typecode) if len(col) else np.zeros(0, dtype=col.typecode)
+
+    def select(self, channel_id=None, start_from=None, start_to=None):
+        # Row indexes for one channel and/or a [start_from, start_to) window of start times
+        if channel_id is not None and channel_id not in self.channel_ids:
+            return []
+        idx = self.channel_ids.get(channel_id)
+        if np is not None:
+            mask = np.ones(len(self), dtype=bool)
+            if channel_id is not None:
+                mask &= self.column("channel") == idx
+            if start_from is not None or start_to is not None:
+                starts = self.column("start")
+                if start_from is not None:
+                    mask &= starts >= start_from
+                if start_to is not None:
+                    mask &= starts < start_to
+            return np.flatnonzero(mask).tolist()
+        ch, st = self.channel, self.start
+        return [i for i in range(len(self))
+                if (channel_id is None or ch[i] == idx)
+                and (start_from is None or st[i] >= start_from)
+                and (start_to is None or st[i] < start_to)]
+
+    def order(self, rows=None, channel_rank=None):
+        # Rows sorted by (channel, start); stable, so ties keep their input order.
+        # channel_rank optionally maps channel index -> position, to order channels by it.
+        rows = list(range(len(self))) if rows is None else list(rows)
+        if np is not None and rows:
+            idx = np.array(rows, dtype=np.int64)
+            chans = self.column("channel")[idx]
+            if channel_rank is not None:
+                chans = np.array(channel_rank, dtype=np.int64)[chans]
+            perm = np.lexsort((self.column("start")[idx], chans))
+            return idx[perm].tolist()
+        ch, st = self.channel, self.start
+        if channel_rank is None:
+            return sorted(rows, key=lambda i: (ch[i], st[i]))
+        return sorted(rows, key=lambda i: (channel_rank[ch[i]], st[i]))
+
+    def take(self, rows):
+        # New table holding the given rows; channel and string ids stay shared with this table
+        out = ProgrammeTable()
+        out.channels, out.channel_ids = self.channels, self.channel_ids
+        out.strings, out.string_ids = self.strings, self.string_ids
+        for name, typecode in self.COLUMNS:
+            col = getattr(self, name)
+            setattr(out, name, array(typecode, [col[i] for i in rows]))
+        return out
+
+
+def open_input(path):
+    # Plain or gzip XML, told apart by the gzip magic; gzip is inflated while it is parsed
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    return gzip.open(path, "rb") if magic == b"\x1f\x8b" else open(path, "rb")
+
+
+def iter_decompressed(resp, is_gz, chunk_size=STREAM_CHUNK_SIZE):
+    # Yield (raw_chunk, xml_bytes) pairs as they come off the socket
+    inflater = zlib.decompressobj(zlib.MAX_WBITS | 16) if is_gz else None
+    while True:
+        chunk = resp.read(chunk_size)
+        if not chunk:
+            break
+        if inflater is None:
+            yield chunk, chunk
+            continue
+        data = inflater.decompress(chunk)
+        # Multi-member gzip: start a fresh inflater for the next member
+        while inflater.eof and inflater.unused_data:
+            rest = inflater.unused_data
+            inflater = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            data += inflater.decompress(rest)
+        yield chunk, data
+    if inflater is not None:
+        tail = inflater.flush()
+        if tail:
+            yield b"", tail
+
+def text_or_none(elem, tag):
+    text = elem.findtext(tag)
+    return text.strip() if text else None
+
+
+def escape_text(text):
+    # ElementTree's escaping, so the streamed documents match what it would have serialized
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def escape_attr(text):
+    text = escape_text(text)
+    if '"' in text:
+        text = text.replace('"', "&quot;")
+    if "\r" in text:
+        text = text.replace("\r", "&#13;")
+    if "\n" in text:
+        text = text.replace("\n", "&#10;")
+    if "\t" in text:
+        text = text.replace("\t", "&#09;")
+    return text
+
+
+def deflate_block(view, start, end, level):
+    # Raw deflate of view[start:end], primed with the 32 KiB before it; ends on a byte boundary
+    # (sync flush) so the blocks can be concatenated, the last one with the final deflate block
+    window = bytes(view[max(0, start - 32768):start])
+    if window:
+        c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=window)
+    else:
+        c = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return c.compress(view[start:end]) + c.flush(zlib.Z_FINISH if end == len(view) else zlib.Z_SYNC_FLUSH)
+
+
+def gzip_compress(data, level=9):
+    # One gzip member with a zero timestamp, its blocks deflated on GZIP_WORKERS threads;
+    # the bytes depend only on the data, level and GZIP_BLOCK_SIZE
+    view = memoryview(data)
+    bounds = [(i, min(i + GZIP_BLOCK_SIZE, len(data))) for i in range(0, len(data), GZIP_BLOCK_SIZE)] or [(0, 0)]
+    with ThreadPoolExecutor(max_workers=GZIP_WORKERS) as pool:
+        crc = pool.submit(zlib.crc32, view)
+        blocks = list(pool.map(lambda b: deflate_block(view, b[0], b[1], level), bounds))
+    xfl = b"\x02" if level == 9 else b"\x04" if level == 1 else b"\x00"
+    header = b"\x1f\x8b\x08\x00\x00\x00\x00\x00" + xfl + b"\xff"
+    return header + b"".join(blocks) + struct.pack("<LL", crc.result(), len(data) & 0xffffffff)
+
+
+class ZoneOffsets:
+    # UTC offset (minutes) of a fixed offset ("+05:00") or a pytz zone at any instant. A zone's
+    # transitions are found once per week of time (hourly probes, bisected to the second) and
+    # cached, so converting a programme time is a bisect instead of a tz computation.
+    SPAN = 7 * 86400
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.fixed = None
+        self.weeks = {}
+        if spec[:1] in ("+", "-"):
+            compact = spec.replace(":", "")
+            self.fixed = (1 if compact[0] == "+" else -1) * (int(compact[1:3]) * 60 + int(compact[3:5]))
+        elif pytz is None:
+            raise ValueError(f"Time zone {spec} needs pytz")
+        else:
+            self.tz = pytz.timezone(spec)
+
+    def probe(self, epoch):
+        return int(datetime.fromtimestamp(epoch, self.tz).utcoffset().total_seconds()) // 60
+
+    def week(self, epoch):
+        # (transition epochs, offsets) of the week holding epoch; offsets[k] applies from bounds[k - 1]
+        lo = epoch // self.SPAN * self.SPAN
+        if lo not in self.weeks:
+            bounds = []
+            offsets = [self.probe(lo)]
+            for t in range(lo + 3600, lo + self.SPAN + 3600, 3600):
+                off = self.probe(t)
+                if off == offsets[-1]:
+                    continue
+                a, b = t - 3600, t
+                while b - a > 1:
+                    mid = (a + b) // 2
+                    if self.probe(mid) == offsets[-1]:
+                        a = mid
+                    else:
+                        b = mid
+                bounds.append(b)
+                offsets.append(off)
+            self.weeks[lo] = (bounds, offsets)
+        return self.weeks[lo]
+
+    def offset_at(self, epoch):
+        if self.fixed is not None:
+            return self.fixed
+        bounds, offsets = self.week(epoch)
+        return offsets[bisect.bisect_right(bounds, epoch)]
+
+    def format(self, epoch):
+        # XMLTV time in this zone, e.g. "20260111000000 +0500"
+        off = self.offset_at(epoch)
+        sign = "+" if off >= 0 else "-"
+        return f"{time.strftime('%Y%m%d%H%M%S', time.gmtime(epoch + off * 60))} {sign}{abs(off) // 60:02d}{abs(off) % 60:02d}"
+
+    def midnight(self, day):
+        # First instant of a local calendar day
+        naive = calendar.timegm(day.timetuple())
+        return naive - self.offset_at(naive - self.offset_at(naive) * 60) * 60
+
+    def days_window(self, epoch, days):
+        # [from, to) epochs of `days` whole local days, starting with the day holding epoch
+        today = datetime.fromtimestamp(epoch + self.offset_at(epoch) * 60, timezone.utc).date()
+        return self.midnight(today), self.midnight(today + timedelta(days=days))
+
+
+def snapshot_path_for(xml_path):
+    # countries/NZAU.epg.xml -> countries/NZAU.epg.snap, channels/Melo-NZ.xml.gz -> channels/Melo-NZ.snap
+    if xml_path.lower().endswith(".gz"):
+        xml_path = xml_path[:-3]
+    return os.path.splitext(xml_path)[0] + ".snap"
+
+
+def snapshot_is_fresh(snap_path, xml_path):
+    # The snapshot exists and was written after the XML (or the XML is gone)
+    if not os.path.exists(snap_path):
+        return False
+    return not os.path.exists(xml_path) or os.stat(snap_path).st_mtime >= os.stat(xml_path).st_mtime
+
+
+def new_snapshot_rows():
+    return {"channels": {}, "programmes": []}
+
+
+def add_snapshot_row(rows, elem):
+    # Record a parsed <channel> or <programme> element
+    if elem.tag == "channel":
+        rows["channels"].setdefault(elem.attrib.get("id"), len(rows["channels"]))
+        return
+    rows["programmes"].append((
+        rows["channels"].setdefault(elem.attrib.get("channel"), len(rows["channels"])),
+        xmltv_epoch(elem.attrib.get("start")),
+        xmltv_epoch(elem.attrib.get("stop")),
+        text_or_none(elem, "title"),
+        text_or_none(elem, "sub-title"),
+        text_or_none(elem, "desc"),
+    ))
+
+
+def write_snapshot(rows, snap_path):
+    # Returns (channels, programmes) written
+    chan_ids = sorted(rows["channels"], key=rows["channels"].get)
+    progs = sorted(rows["programmes"], key=lambda r: (r[0], r[1]))
+
+    def string_table(values):
+        offsets = array("Q", [0])
+        blob = bytearray()
+        for v in values:
+            blob += v.encode("utf-8")
+            offsets.append(len(blob))
+        return offsets, bytes(blob)
+
+    strings = {}
+    title = array("i", (strings.setdefault(r[3], len(strings)) if r[3] is not None else -1 for r in progs))
+    sub = array("i", (strings.setdefault(r[4], len(strings)) if r[4] is not None else -1 for r in progs))
+    chan_rows = array("Q", [0] * (len(chan_ids) + 1))
+    for r in progs:
+        chan_rows[r[0] + 1] += 1
+    for i in range(len(chan_ids)):
+        chan_rows[i + 1] += chan_rows[i]
+    chan_offsets, chan_blob = string_table(chan_ids)
+    str_offsets, str_blob = string_table(sorted(strings, key=strings.get))
+    desc_offsets, desc_blob = string_table(r[5] or "" for r in progs)
+    sections = {
+        "chan_offsets": chan_offsets, "chan_blob": chan_blob, "chan_rows": chan_rows,
+        "start": array("q", (r[1] for r in progs)), "stop": array("q", (r[2] for r in progs)),
+        "title": title, "sub": sub,
+        "str_offsets": str_offsets, "str_blob": str_blob,
+        "desc_offsets": desc_offsets, "desc_blob": desc_blob,
+        "desc_set": array("b", (r[5] is not None for r in progs)),  # 0: no <desc> text, as opposed to a blank one
+    }
+    payloads = []
+    for name in SNAPSHOT_SECTIONS:
+        data = sections[name]
+        if isinstance(data, array):
+            if sys.byteorder == "big":
+                data = array(data.typecode, data)
+                data.byteswap()
+            data = data.tobytes()
+        payloads.append(data)
+    header_len = len(SNAPSHOT_MAGIC) + 8 + 16 * len(SNAPSHOT_SECTIONS)
+    table = []
+    pos = header_len
+    for data in payloads:
+        pos += -pos % 8  # keep every column 8-byte aligned for zero-copy casts
+        table.append((pos, len(data)))
+        pos += len(data)
+    tmp_path = snap_path + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack("<Q", len(SNAPSHOT_SECTIONS)))
+        for off, length in table:
+            f.write(struct.pack("<QQ", off, length))
+        for (off, _), data in zip(table, payloads):
+            f.write(b"\0" * (off - f.tell()))
+            f.write(data)
+    os.replace(tmp_path, snap_path)
+    return len(chan_ids), len(progs)
+
+
+def snapshot_sections(mm, snap_path):
+    # {section name: (offset, length)} of a mapped snapshot
+    if mm[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError(f"Not a snapshot file: {snap_path}")
+    base = len(SNAPSHOT_MAGIC)
+    count = struct.unpack_from("<Q", mm, base)[0]
+    return {name: struct.unpack_from("<QQ", mm, base + 8 + 16 * i) for i, name in enumerate(SNAPSHOT_SECTIONS[:count])}
+
+
+def feed_coverage(xml_path, channel_ids=None):
+    # {channel id: last stop (its start where a programme has none)} of a stored feed, the coverage
+    # Fetch.Epgs.py records while fetching; measured from the snapshot when fresh, else from the XML.
+    # Stands in for feeds.state.json, which is not committed, so a fresh checkout has no record.
+    wanted = set(channel_ids) if channel_ids else None
+    horizons = {}
+
+    def note(cid, start, stop):
+        end = stop if stop != NO_TIME else start
+        if (wanted is None or cid in wanted) and end != NO_TIME and end > horizons.get(cid, end - 1):
+            horizons[cid] = end
+
+    snap_path = snapshot_path_for(xml_path)
+    if snapshot_is_fresh(snap_path, xml_path):
+        with open(snap_path, "rb") as f:
+            data = f.read()
+        sections = snapshot_sections(data, snap_path)
+
+        def column(name, typecode):
+            off, length = sections[name]
+            col = array(typecode)
+            col.frombytes(data[off:off + length])
+            if sys.byteorder == "big":
+                col.byteswap()
+            return col
+
+        chan_offsets, chan_rows = column("chan_offsets", "Q"), column("chan_rows", "Q")
+        starts, stops = column("start", "q"), column("stop", "q")
+        blob = sections["chan_blob"][0]
+        for i in range(len(chan_rows) - 1):
+            cid = data[blob + chan_offsets[i]:blob + chan_offsets[i + 1]].decode("utf-8")
+            for r in range(chan_rows[i], chan_rows[i + 1]):
+                note(cid, starts[r], stops[r])
+        return horizons
+    with open_input(xml_path) as f:
+        root = None
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if root is None:
+                root = elem
+            elif event == "end" and elem.tag in ("channel", "programme"):
+                if elem.tag == "programme":
+                    note(elem.attrib.get("channel"), xmltv_epoch(elem.attrib.get("start")), xmltv_epoch(elem.attrib.get("stop")))
+                root.clear()
+    return horizons
@@ -0,0 +1,67 @@
+import os
+import sys
+import types
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import epgcore  # noqa: E402
+import epgchannel  # noqa: E402
+from epgcore import ProgrammeTable, new_snapshot_rows, add_snapshot_row, write_snapshot  # noqa: E402
+
+CFG = types.SimpleNamespace(PROGRAMME_TITLE="Default title", PROGRAMME_SUBTITLE="Default sub-title",
+                            PROGRAMME_DESCRIPTION="Default desc")
+
+FEED = """<?xml version="1.0" encoding="utf-8"?>
+<tv>
+  <channel id="A.nz"><display-name>A</display-name></channel>
+  <programme channel="A.nz" start="20251117060000 +0000" stop="20251117070000 +0000">
+    <title>Blank desc</title>
+    <desc>   </desc>
+  </programme>
+  <programme channel="A.nz" start="20251117070000 +0000" stop="20251117080000 +0000">
+    <title>No desc</title>
+  </programme>
+  <programme channel="A.nz" start="20251117080000 +0000" stop="20251117090000 +0000">
+    <title>Empty desc</title>
+    <desc></desc>
+  </programme>
+  <programme channel="A.nz" start="20251117090000 +0000" stop="20251117100000 +0000">
+    <title>Desc</title>
+    <desc> Some text </desc>
+  </programme>
+</tv>
+"""
+
+
+def snapshot_of(tmp_path):
+    xml_path = tmp_path / "A.epg.xml"
+    xml_path.write_text(FEED, encoding="utf-8")
+    rows = new_snapshot_rows()
+    for _, elem in ET.iterparse(str(xml_path)):
+        if elem.tag in ("channel", "programme"):
+            add_snapshot_row(rows, elem)
+    snap_path = str(tmp_path / "A.epg.snap")
+    write_snapshot(rows, snap_path)
+    return str(xml_path), snap_path
+
+
+def descs(table):
+    return [table.text(table.desc[i]) for i in range(len(table))]
+
+
+def test_snapshot_keeps_blank_desc_like_the_xml(tmp_path):
+    xml_path, snap_path = snapshot_of(tmp_path)
+    from_xml = epgchannel.stream_programmes_from_file(CFG, xml_path, {"A.nz"}, ProgrammeTable())
+    from_snap = epgchannel.read_programmes_from_snapshot(CFG, snap_path, "A.nz", ProgrammeTable())
+    assert descs(from_xml) == ["", "Default desc", "Default desc", "Some text"]
+    assert epgchannel.table_rows(from_snap) == epgchannel.table_rows(from_xml)
+
+
+def test_snapshot_without_desc_set_uses_the_default(tmp_path, monkeypatch):
+    # Snapshots written before the "desc_set" section have no way to tell a blank <desc> from none
+    monkeypatch.setattr(epgcore, "SNAPSHOT_SECTIONS", epgcore.SNAPSHOT_SECTIONS[:-1])
+    _, snap_path = snapshot_of(tmp_path)
+    monkeypatch.undo()
+    from_snap = epgchannel.read_programmes_from_snapshot(CFG, snap_path, "A.nz", ProgrammeTable())
+    assert descs(from_snap) == ["Default desc", "Default desc", "Default desc", "Some text"]